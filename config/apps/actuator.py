@@ -0,0 +1,67 @@
+class Actuator:
+    """
+    Reconciles a desired state with the last confirmed device state.
+
+    A command is only sent when the cached entity state differs from the desired
+    one, or when the state has not been re-asserted for refresh_interval seconds.
+    The entity has to be in the app's state cache.
+
+    With an arbiter the command is only sent while the app's actuator_token owns the entity,
+    an app that has been taken over is refused.
+    """
+
+    # Seconds a sent command is trusted before its state change has been confirmed
+    confirm_window = 5
+
+    def __init__(self, app, entity, refresh_interval, arbiter=None):
+        self.app = app
+        self.entity = entity
+        self.refresh_interval = refresh_interval
+        self.arbiter = arbiter
+
+        self.last_sent_state = None
+        self.last_sent_at = None
+
+        self.sent = 0
+        self.suppressed = 0
+        self.refused = 0
+
+    async def set(self, state, service, **service_data) -> bool:
+        """Returns True if a command was sent"""
+
+        now = self.app.get_timestamp()
+
+        if self.last_sent_at is not None:
+            since_sent = now - self.last_sent_at
+
+            confirmed = self.app.get_cached_state(self.entity) == state
+            pending = self.last_sent_state == state and since_sent < Actuator.confirm_window
+
+            if (confirmed or pending) and since_sent < self.refresh_interval:
+                self.suppressed += 1
+                return False
+
+        if self.arbiter is None:
+            await self.app.call_service(service, entity_id=self.entity, **service_data)
+
+        elif not await self.arbiter.send(
+            self.entity, self.app.actuator_token, self.app.call_service, service, entity_id=self.entity, **service_data
+        ):
+            self.refused += 1
+            return False
+
+        self.last_sent_state = state
+        self.last_sent_at = now
+        self.sent += 1
+        return True
+
+    def expected_state(self):
+        """The state just sent while it is waiting to be confirmed, otherwise the cached state"""
+
+        if self.last_sent_at is not None and self.app.get_timestamp() - self.last_sent_at < Actuator.confirm_window:
+            return self.last_sent_state
+
+        return self.app.get_cached_state(self.entity)
+
+    def stats(self):
+        return {"sent": self.sent, "suppressed": self.suppressed, "refused": self.refused}
@@ -0,0 +1,98 @@
+import asyncio
+from process_shared import ProcessShared
+
+class ActuatorArbiter:
+    """
+    Decides which app may command the actuators shared by several apps.
+
+    acquire() hands the entities to an app at once and returns a fencing token, higher than
+    every token before it. The previous owner is told through its on_actuators_lost() before
+    acquire() returns, and any command it still sends carries its old token and is refused.
+    Commands to an entity are sent under the entity's lock with the token checked inside it,
+    so the first command of a new owner waits for one of the old owner that is in flight,
+    and the two never interleave.
+
+    Apps register in initialize and unregister in terminate.
+    """
+
+    def __init__(self):
+        self.apps = {}              # app name -> registered app
+        self.owners = {}            # entity -> (app, token)
+        self.locks = {}             # entity -> asyncio.Lock
+        self.last_token = 0
+
+        self.handovers = 0
+        self.refused = 0
+
+    def register(self, app):
+        self.apps[app.name] = app
+
+    def unregister(self, app):
+        self.release(app)
+
+        if self.apps.pop(app.name, None) is not None and not self.apps:
+            release(self)
+
+    def acquire(self, app, entities) -> int:
+        """Makes app the owner of entities and returns its token"""
+
+        self.last_token += 1
+        token = self.last_token
+        losers = {}
+
+        for entity in entities:
+            owner = self.owners.get(entity)
+
+            if owner is not None and owner[0] is not app:
+                losers[owner[0].name] = owner[0]
+
+            self.owners[entity] = (app, token)
+
+        for loser in losers.values():
+            self.handovers += 1
+            loser.on_actuators_lost(app)
+
+        return token
+
+    def release(self, app):
+        """Gives up every entity app still owns, a later command of app is refused"""
+
+        for entity, (owner, _) in list(self.owners.items()):
+            if owner is app:
+                del self.owners[entity]
+
+    def is_owner(self, entity, token) -> bool:
+        owner = self.owners.get(entity)
+        return owner is not None and owner[1] == token
+
+    async def send(self, entity, token, command, *args, **kwargs) -> bool:
+        """Awaits command(*args, **kwargs) if token owns entity, returns False if it was refused"""
+
+        lock = self.locks.get(entity)
+
+        if lock is None:
+            lock = self.locks[entity] = asyncio.Lock()
+
+        async with lock:
+            if not self.is_owner(entity, token):
+                self.refused += 1
+                return False
+
+            await command(*args, **kwargs)
+            return True
+
+    def stats(self):
+        return {
+            "owners": {entity: owner.name for entity, (owner, _) in self.owners.items()},
+            "token": self.last_token,
+            "handovers": self.handovers,
+            "refused": self.refused,
+        }
+
+shared = ProcessShared(ActuatorArbiter)
+
+def get_arbiter() -> ActuatorArbiter:
+    return shared.get()
+
+def release(released: ActuatorArbiter):
+    shared.release(released)
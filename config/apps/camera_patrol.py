@@ -1,7 +1,8 @@
 import appdaemon.plugins.hass.hassapi as hass
-import time
+import asyncio
 from enum import IntEnum
 from support import Support
+from patrol_coordinator import PatrolCoordinator, get_coordinator
 
 
 class DoorState(IntEnum):
@@ -12,6 +13,12 @@ class DoorState(IntEnum):
 
 class CameraPatrol(Support):
 
+    dev_log_prefix = "-->"
+
+    # Without a position entity the select only shows the requested preset, not the arrival,
+    # so the move is given this long to finish
+    move_settle_time = 9
+
     async def initialize(self):
         self.is_patroling_ent = self.args.get("is_patroling_ent")
         self.is_in_privacy_ent = self.args.get("is_in_privacy_ent")
@@ -21,30 +28,43 @@ class CameraPatrol(Support):
         self.move_to_preset_ent = self.args.get("move_to_preset_ent")
         self.presets = self.args.get("presets", [])
         self.movement_timer = int(self.args.get("movement_timer"))
+        # Cameras sharing a PTZ controller never move at the same time
+        self.ptz_controller = self.args.get("ptz_controller", "default")
+
+        # Where the camera reports its actual position, in the state or in position_attribute
+        self.position_ent = self.args.get("position_ent")
+        self.position_attribute = self.args.get("position_attribute")
+        self.preset_arrival_timeout = float(self.args.get("preset_arrival_timeout", 20))
+        self.privacy_switch_timeout = float(self.args.get("privacy_switch_timeout", 5))
 
         self.debug = bool(self.args.get("debug", True))
 
-        self.is_sleep_state_ent = "input_boolean.is_sleep_state"
-        self.door_sensor_ent = "binary_sensor.bedroom_door_sensor_contact"
-        
+        self.init_support(self.debug)
+
+        # Sleep state, door sensor and dwell timers are shared with the other cameras
+        self.coordinator: PatrolCoordinator = get_coordinator()
+        await self.coordinator.register(self)
+
         self.is_patroling = await self.get_state(self.is_patroling_ent) == "on"
         self.is_in_privacy = await self.get_state(self.is_in_privacy_ent) == "on"
+        self.is_motion = await self.get_state(self.motion_alarm_ent) == "on"
         
-        self.loop_counter = 0
+        # Set by the coordinator when the camera has been still for movement_timer at the current preset
+        self.dwell_done = asyncio.Event()
         self.last_patrol_start_time = None
         self.door_state = DoorState.CLOSED_FROM_INSIDE
         self.privacy_set_by_door_state = False
 
         self.listen_state(self.on_is_patroling_ent_change, self.is_patroling_ent)
         self.listen_state(self.on_is_in_privacy_ent_change, self.is_in_privacy_ent)
-        self.listen_state(self.on_door_sensor_ent_change, self.door_sensor_ent)
+        self.listen_state(self.on_motion_alarm_ent_change, self.motion_alarm_ent)
 
         self.dev_log("is_patroling", self.is_patroling)
         self.dev_log("is_in_privacy", self.is_in_privacy)
         self.dev_log("door_state", self.door_state)
 
         if(self.is_in_privacy):
-            self.create_task(self.turn_on_privacy())
+            self.start_privacy_task(self.turn_on_privacy)
         else:
             if(self.is_patroling):
                 self.start_patrol()
@@ -53,8 +73,8 @@ class CameraPatrol(Support):
 
 
 
-    def on_is_patroling_ent_change(self, entity, attribute, old, new, kwargs):
-        self.dev_log(f"{entity} changed from {old} to {new}")
+    async def on_is_patroling_ent_change(self, entity, attribute, old, new, kwargs):
+        self.dev_log("{entity} changed from {old} to {new}", entity=entity, old=old, new=new)
         
         if new == "on":
             self.start_patrol()
@@ -62,20 +82,53 @@ class CameraPatrol(Support):
             self.stop_patrol()
 
 
-    def on_is_in_privacy_ent_change(self, entity, attribute, old, new, kwargs):
-        self.dev_log(f"{entity} changed from {old} to {new}")
+    async def on_is_in_privacy_ent_change(self, entity, attribute, old, new, kwargs):
+        self.dev_log("{entity} changed from {old} to {new}", entity=entity, old=old, new=new)
         
         if new == "on":
-            self.create_task(self.turn_on_privacy())
+            self.start_privacy_task(self.turn_on_privacy)
         else:
-            self.create_task(self.turn_off_privacy())
+            self.start_privacy_task(self.turn_off_privacy)
 
 
-    def on_door_sensor_ent_change(self, entity, attribute, old, new, kwargs):
-        self.dev_log(f"{entity} changed from {old} to {new}")
+    def start_privacy_task(self, factory):
+        # Turning privacy on and off share one task, the latest request replaces a pending one
+        self.tasks.start("privacy", factory)
+
+
+    async def terminate(self):
+        self.tasks.cancel_all()
+        self.coordinator.unregister(self)
+        await self.release_entities()
+
+
+    def on_door_sensor_change(self, old, new):
+        """Called by the coordinator, which holds the door sensor subscription"""
+        self.dev_log("{entity} changed from {old} to {new}", entity=PatrolCoordinator.door_sensor_ent, old=old, new=new)
+
+        if self.advance_door_state():
+            self.tasks.start("door", self.apply_door_state)
+
+
+    async def on_motion_alarm_ent_change(self, entity, attribute, old, new, kwargs):
+        self.is_motion = new == "on"
+        self.reset_dwell_timer()
+
+
+    def reset_dwell_timer(self):
+        """
+        Restarts the countdown at the current preset. It only runs while there is no motion
+        and fires after movement_timer + 1 seconds, matching the old one second polling loop.
+        """
+        if self.is_motion:
+            self.coordinator.cancel_dwell(self)
+        else:
+            self.coordinator.schedule_dwell(self, self.movement_timer + 1)
+
+
+    def on_dwell_done(self):
+        self.dwell_done.set()
 
-        self.create_task(self.handle_door_sensor_change())
-    
 
     def start_patrol(self, request = None, kwargs = None):
         
@@ -83,188 +136,181 @@ class CameraPatrol(Support):
 
         self.is_patroling = True
         self.is_in_privacy = False
-        self.last_patrol_start_time = time.time()
+        self.last_patrol_start_time = self.get_timestamp()
 
-        self.create_task(self.camera_patrol(self))
+        # Replaces a patrol that is still running
+        self.tasks.start("patrol", self.camera_patrol, min_backoff=30, on_error=self.on_patrol_error)
 
 
     def stop_patrol(self, request = None, kwargs = None):
         
         self.dev_log("Camera patrol stopped")
         self.is_patroling = False
+
+        # Cancelled wherever it is, a patrol stopped mid-move must not go on to the next preset
+        self.tasks.cancel("patrol")
+        self.coordinator.cancel_dwell(self)
     
     
 
-    async def camera_patrol(self, kwargs):
+    async def camera_patrol(self):
         self.dev_log("Starting camera patrol")
 
-        try:
-            self.dev_log("sleep state: ", await self.get_state(self.is_sleep_state_ent))
-            self.dev_log("door_sensor_ent: ", await self.get_state(self.door_sensor_ent))
-            if await self.get_state(self.is_sleep_state_ent) == "on":
-                
-                if await self.get_state(self.door_sensor_ent) == "off": # off == contact...
-                    self.door_state = DoorState.CLOSED_FROM_INSIDE
-                    self.dev_log("door_state set to", self.door_state)
-                else:
-                    self.dev_log("Bedroom door not closed.")
-                    await self.call_service("input_boolean/turn_off", entity_id=self.is_patroling_ent)
-
-                    if(self.camera_name == "camera-1"):
-                        await self.call_service(
-                            "notify/mobile_app_robins_oneplus_13",
-                            title="Camera patrol",
-                            message="Sleep state - Door not closed, stopping.",
-                            data= { "ttl": 0, "priority": "high" }
-                        )
-                    return
-
-            # turn off privacy bool entity
-            await self.call_service("input_boolean/turn_off", entity_id=self.is_in_privacy_ent)
-
-            await self.call_service("python_script/set_state", entity_id=self.motion_alarm_ent, state="off")
-            await self.call_service("switch/turn_off", entity_id=self.switch_privacy_entity)
-            await self.sleep(1)
-
-            # Outer infinite loop (repeat: while True)
-            while self.is_patroling:
-                self.dev_log("Going trough preset list")
-                
-                # For each preset in the list
-                for preset in self.presets:
-                    if not self.is_patroling:
-                        break
-
-                    self.dev_log(f"Moving to preset: {preset}")
-                    # Move the camera by selecting the preset
-                    await self.call_service("select/select_option", entity_id=self.move_to_preset_ent, option=preset)
-                    
-                    self.loop_counter = 0
-                    while (self.loop_counter <= int(self.movement_timer)) and self.is_patroling:
-                        # self.dev_log("Looping: ", self.loop_counter)
-                        # self.dev_log("motion alarm state: ", await self.get_state(self.motion_alarm_ent))
-
-                        # Wait a second between each check
-                        await self.sleep(1)
-
-                        # Update the counter based on the motion alarm state
-                        if await self.get_state(self.motion_alarm_ent) == "off":
-                            self.loop_counter += 1
-                        else:
-                            self.loop_counter = 0
-                            
-        except Exception as e:
-            self.log("camera_patrol -> Error caught", e)
-
-            self.send_mobile_notification(
-                "Camera patrol",
-                f"An error happened: {e}"
-            )
+        sleep_state = self.coordinator.sleep_state
+        self.dev_log("sleep state: ", sleep_state)
+
+        if sleep_state == "on":
             
-            await self.sleep(30)
-            await self.camera_patrol(self)
+            door_sensor_state = self.coordinator.door_sensor_state
+            self.dev_log("door_sensor_ent: ", door_sensor_state)
 
+            if door_sensor_state == "off": # off == contact...
+                self.door_state = DoorState.CLOSED_FROM_INSIDE
+                self.dev_log("door_state set to", self.door_state)
+            else:
+                self.dev_log("Bedroom door not closed.")
+                await self.call_service("input_boolean/turn_off", entity_id=self.is_patroling_ent)
 
-    
-    async def turn_on_privacy(self):
-        self.dev_log("Turning on privacy mode.")
+                if(self.camera_name == "camera-1"):
+                    self.send_mobile_notification("Camera patrol", "Sleep state - Door not closed, stopping.")
+                return
 
-        try:
-            self.is_in_privacy = True
-            self.is_patroling = False
-            await self.call_service("input_boolean/turn_off", entity_id=self.is_patroling_ent)
-            
-            await self.call_service("switch/turn_off", entity_id=self.switch_privacy_entity)
-            await self.sleep(1)
+        # turn off privacy bool entity
+        await self.call_service("input_boolean/turn_off", entity_id=self.is_in_privacy_ent)
 
-            if(not self.is_in_privacy): 
-                self.dev_log("Set privacy aborted, not in privacy anymore.")
-                return
-            
-            await self.move_to_privacy_mode()
-            await self.sleep(9)            
+        await self.call_service("python_script/set_state", entity_id=self.motion_alarm_ent, state="off")
+        await self.call_service("switch/turn_off", entity_id=self.switch_privacy_entity)
+        await self.wait_for_privacy_switch("off")
 
-            if(not self.is_in_privacy): 
-                self.dev_log("Set privacy aborted, not in privacy anymore.")
-                return
+        # Outer infinite loop (repeat: while True)
+        while self.is_patroling:
+            self.dev_log("Going trough preset list")
             
-            await self.call_service("switch/turn_on", entity_id=self.switch_privacy_entity)
+            # For each preset in the list
+            for preset in self.presets:
+                if not self.is_patroling:
+                    break
+
+                self.dev_log("Moving to preset: {preset}", preset=preset)
+                # Move the camera by selecting the preset, once its PTZ controller is free
+                await self.coordinator.move_to_preset(self, preset)
+                
+                # Stay until there has been no motion for movement_timer, motion resets the timer
+                self.dwell_done.clear()
+                self.reset_dwell_timer()
+                await self.dwell_done.wait()
 
-            # Reset the alarm and detection states
-            await self.call_service("python_script/set_state", entity_id=self.motion_alarm_ent, state="off")
 
-        except Exception as e:
-            self.log("turn_on_privacy -> Error caught", e)
+    def on_patrol_error(self, e):
+        self.send_mobile_notification(
+            "Camera patrol",
+            f"An error happened: {e}"
+        )
 
-            await self.sleep(1)
-            self.create_task(self.turn_on_privacy())
+
+    async def turn_on_privacy(self):
+        self.dev_log("Turning on privacy mode.")
+
+        self.is_in_privacy = True
+        self.is_patroling = False
+        await self.call_service("input_boolean/turn_off", entity_id=self.is_patroling_ent)
+        
+        await self.call_service("switch/turn_off", entity_id=self.switch_privacy_entity)
+        await self.wait_for_privacy_switch("off")
+
+        if(not self.is_in_privacy): 
+            self.dev_log("Set privacy aborted, not in privacy anymore.")
+            return
+        
+        await self.move_to_privacy_mode()
+        await self.wait_for_preset("Privacy")
+
+        if(not self.is_in_privacy): 
+            self.dev_log("Set privacy aborted, not in privacy anymore.")
+            return
+        
+        await self.call_service("switch/turn_on", entity_id=self.switch_privacy_entity)
+
+        # Reset the alarm and detection states
+        await self.call_service("python_script/set_state", entity_id=self.motion_alarm_ent, state="off")
 
     async def move_to_privacy_mode(self):
-        await self.call_service("select/select_option", entity_id=self.move_to_preset_ent, option="Privacy")
+        await self.coordinator.move_to_preset(self, "Privacy")
+
+
+    async def wait_for_preset(self, preset):
+        """Returns once the camera reports being at preset, False if it did not within preset_arrival_timeout"""
+
+        if self.position_ent is None:
+            await self.sleep(CameraPatrol.move_settle_time)
+            return True
+
+        arrived = await self.wait_for_state(
+            self.position_ent,
+            preset,
+            attribute=self.position_attribute,
+            timeout=self.preset_arrival_timeout
+        )
+
+        if not arrived:
+            self.log(f"{self.camera_name} did not reach preset {preset} within {self.preset_arrival_timeout} s")
+
+        return arrived
+
+
+    async def wait_for_privacy_switch(self, state):
+        switched = await self.wait_for_state(self.switch_privacy_entity, state, timeout=self.privacy_switch_timeout)
+
+        if not switched:
+            self.log(f"{self.switch_privacy_entity} not {state} within {self.privacy_switch_timeout} s")
+
+        return switched
     
     
     # NOTE will not set the privacy ent, that would create a infinite loop
     async def turn_off_privacy(self):
         self.dev_log("Turning off privacy mode.")
 
-        try:
-            self.is_in_privacy = False
-            
-            await self.call_service("switch/turn_off", entity_id=self.switch_privacy_entity)
-            
-            # Reset the alarm and detection states
-            await self.call_service("python_script/set_state", entity_id=self.motion_alarm_ent, state="off")
-
-        except Exception as e:
-            self.log("turn_off_privacy -> Error caught", e)
-
-            await self.sleep(1)
-            self.create_task(self.turn_on_privacy())
-
-
-    async def handle_door_sensor_change(self, restartFromError = False):
+        self.is_in_privacy = False
+        
+        await self.call_service("switch/turn_off", entity_id=self.switch_privacy_entity)
+        
+        # Reset the alarm and detection states
+        await self.call_service("python_script/set_state", entity_id=self.motion_alarm_ent, state="off")
 
-        try: 
-            self.dev_log("Handling door sensor change.")
-            
-            if(await self.get_state(self.is_sleep_state_ent) == "off"):
-                self.dev_log("Sleep state is off, returning.")
-                return
-            
-            if(self.is_patroling and not self.privacy_set_by_door_state):
-                self.dev_log("Currently patrolling, setting privacy.")
-                self.privacy_set_by_door_state = True
 
-            if(not self.privacy_set_by_door_state):
-                self.dev_log("Not patrolling and privacy not set by door state, returning.")
-                return
-            
-            if(not restartFromError):
-                self.door_state = (self.door_state + 1) % 4
-                
-            self.dev_log("door_state: ", self.door_state)
+    def advance_door_state(self) -> bool:
+        """Moves to the next door state, returns False if the door change is ignored"""
 
-            # Going out from bedroom, entering privacy mode
-            if self.door_state == DoorState.OPENED_FROM_INSIDE:
-                await self.move_to_privacy_mode()
-                await self.call_service("input_boolean/turn_on", entity_id=self.is_in_privacy_ent)
+        self.dev_log("Handling door sensor change.")
+        
+        if(self.coordinator.sleep_state == "off"):
+            self.dev_log("Sleep state is off, returning.")
+            return False
+        
+        if(self.is_patroling and not self.privacy_set_by_door_state):
+            self.dev_log("Currently patrolling, setting privacy.")
+            self.privacy_set_by_door_state = True
 
-            # Going in to bedroom, entering patrol mode
-            elif self.door_state == DoorState.CLOSED_FROM_INSIDE:
-                await self.call_service("input_boolean/turn_on", entity_id=self.is_patroling_ent)
-                self.privacy_set_by_door_state = False
+        if(not self.privacy_set_by_door_state):
+            self.dev_log("Not patrolling and privacy not set by door state, returning.")
+            return False
+        
+        self.door_state = (self.door_state + 1) % 4
+        self.dev_log("door_state: ", self.door_state)
 
-        except Exception as e:
-            self.log("handle_door_sensor_change -> Error caught", e)
+        return True
 
-            await self.sleep(1)
-            self.create_task(self.handle_door_sensor_change(True))
 
+    async def apply_door_state(self):
+        # Only acts on door_state, so a restart after an error does not advance it again
 
+        # Going out from bedroom, entering privacy mode
+        if self.door_state == DoorState.OPENED_FROM_INSIDE:
+            await self.move_to_privacy_mode()
+            await self.call_service("input_boolean/turn_on", entity_id=self.is_in_privacy_ent)
 
-    def dev_log(self, msg, args=None):
-        if self.debug:
-            if args is None:
-                self.log(f"--> {msg}")
-            else:
-                self.log(f"--> {msg}: {args}")
\ No newline at end of file
+        # Going in to bedroom, entering patrol mode
+        elif self.door_state == DoorState.CLOSED_FROM_INSIDE:
+            await self.call_service("input_boolean/turn_on", entity_id=self.is_patroling_ent)
+            self.privacy_set_by_door_state = False
@@ -1,5 +1,17 @@
 import asyncio
+import os
 from support import Support
+from actuator import Actuator
+from actuator_arbiter import ActuatorArbiter, get_arbiter
+from tick_timer import TickTimer
+from runtime_accumulator import RuntimeAccumulator
+from state_store import StateStore
+from power_draw_analyzer import PowerDrawAnalyzer
+from coalescer import Coalescer
+from settings_registry import SettingsRegistry, Setting, parse_bool
+from thermal_model import ThermalModel
+from decision_log import DecisionLog
+from zones import ZoneTable, parse_zones
 from enum import Enum
 import traceback
 
@@ -29,42 +41,77 @@ class BaseClimateControl(Support):
     bedroom_heater_ent = "switch.smart_socket_1"
 
     error_restart_interval = 10
+    state_cache_max_age    = 1800   # seconds without a sensor update before cached reads count as stale
+    actuator_refresh_interval = 900 # seconds before an unchanged actuator state is sent again
+
+    state_version          = 3      # bump when the snapshot format changes, older snapshots are then ignored
+    state_write_interval   = 60     # min seconds between snapshot writes
+    state_max_age          = 3600   # seconds, older snapshots are not restored
     compressor_running_draw_threshold  = 75     # CONST - Threshold for when compressor is running, the ac would draw more than this
+    power_draw_window      = 1800   # seconds of power draw samples kept for the rolling statistics
+    thermal_model_version  = 1
+    thermal_model_write_interval = 600
+    decision_log_segment_duration = 86400 # seconds of ticks per decision log segment
+    decision_log_max_segments = 92        # segments kept, older ones are deleted
 
     async def initialize(self):
 
         self.debug          = bool(self.args.get("debug", False))
         self.dev_logs       = bool(self.args.get("dev_logs", False))
+
+        self.init_support(self.dev_logs)
         
         self.is_active_ent  = self.args.get("is_active_ent")
 
-        # Used to stop the main loop task
-        self.loops: set[asyncio.Task] = set()
+        # Rooms compared against their targets, the zones arg in apps.yaml or the default three rooms
+        self.zones = parse_zones(self.args.get("zones"))
+        self.zone_table = ZoneTable(self.zones)
+
+        # "polling" ticks every polling_interval, "event" ticks when a tick input changes
+        # and only uses polling_interval as a watchdog
+        self.trigger_mode       = self.args.get("trigger_mode", "polling")
+        self.trigger_debounce   = float(self.args.get("trigger_debounce", 5))
+
+        # Seconds ahead the thermal model may start cooling a room predicted to get too warm, 0 is off
+        self.predictive_lead_time = float(self.args.get("predictive_lead_time", 0))
+
+        # On-disk snapshot of the mutable state, restored in on_init_done
+        self.state_store = StateStore(
+            os.path.join(self.config_dir, "state", f"{self.name}.json"),
+            BaseClimateControl.state_version,
+            BaseClimateControl.state_write_interval
+        )
+        self.resumed_state = False # start() keeps the restored state instead of resetting it
+        self.resumed_saved_at = None
+
+        # Learned from every tick and kept across restarts of any length
+        self.thermal_model = ThermalModel()
+        self.thermal_model_store = StateStore(
+            os.path.join(self.config_dir, "state", f"{self.name}_thermal_model.json"),
+            BaseClimateControl.thermal_model_version,
+            BaseClimateControl.thermal_model_write_interval
+        )
+        self.restore_thermal_model()
+
+        # One fixed-width record per tick, read back with decision_log.load()
+        self.decision_log = DecisionLog(
+            os.path.join(self.config_dir, "state", "decision_log", self.name),
+            self.get_decision_columns(),
+            BaseClimateControl.decision_log_segment_duration,
+            BaseClimateControl.decision_log_max_segments
+        )
 
         # --------------------------------------------------------------------
         # Mutable state initialization
         # --------------------------------------------------------------------        
         self.is_cooling                         = False
         self.is_any_fans_active                 = False
-        self.current_hour                       = None 
-        self.fan_runtime_mins_current_hour      = None
-        self.compressor_low_draw_timer          = 0    # Used to track when compressor low draw started
-        self.current_defrosting_timer           = 0    # seconds on the current defrosting timer
-
-        # NOTE time input needs to end with _time for the conversions to work
-        base_settings_ents = [
-            "input_number.climate_control_polling_interval",
-            # "input_number.climate_control_min_time_fan_per_hour",
-            "input_number.climate_control_compressor_outside_temp_cutoff",
-            "input_number.climate_control_compressor_low_draw_threshold",
-            "input_number.climate_control_compressor_max_low_draw_duration",
-            "input_number.climate_control_defrost_cycle_duration",
-            "input_boolean.climate_control_disable_ac_compressor",
-            "input_boolean.climate_control_disable_external_ac_fan",
-            "input_boolean.climate_control_disable_freeze_warnings",
-        ]
+        self.fan_runtime                        = RuntimeAccumulator() # fan on/off transitions
+        self.fan_runtime_mins_current_hour      = 0
+        self.defrost_started_at                 = None # timestamp the current defrosting cycle started
+        self.freeze_check_timer                 = None # fires when the current low draw reaches compressor_max_low_draw_duration
 
-        # Entity-driven settings (overwritten by init_settings_members)
+        # Entity-driven settings (overwritten by the settings registry)
         self.polling_interval                   = None
         self.compressor_outside_temp_cutoff     = None
         self.compressor_low_draw_threshold      = None # Threshold for when the compressor is running but drawing low watts the usual, might be freezed over
@@ -77,147 +124,477 @@ class BaseClimateControl(Support):
         # Is overwritten by subclasses
         self.min_time_fan_per_hour              = None
 
-        await self.init_settings_members(base_settings_ents)
+        self.settings = SettingsRegistry(self)
+
+        await self.settings.register([
+            Setting("input_number.climate_control_polling_interval",                   "polling_interval"),
+            Setting("input_number.climate_control_compressor_outside_temp_cutoff",     "compressor_outside_temp_cutoff"),
+            Setting("input_number.climate_control_compressor_low_draw_threshold",      "compressor_low_draw_threshold",    on_change=self.on_low_draw_threshold_change),
+            Setting("input_number.climate_control_compressor_max_low_draw_duration",   "compressor_max_low_draw_duration", on_change=self.on_max_low_draw_duration_change),
+            Setting("input_number.climate_control_defrost_cycle_duration",             "defrost_cycle_duration"),
+            Setting("input_boolean.climate_control_disable_ac_compressor",             "disable_ac_compressor",            parse_bool),
+            Setting("input_boolean.climate_control_disable_external_ac_fan",           "disable_external_ac_fan",          parse_bool),
+            Setting("input_boolean.climate_control_disable_freeze_warnings",           "disable_freeze_warnings",          parse_bool),
+        ])
+
+        # Fed by every power draw change, detects a freeze without waiting for a tick
+        self.power_draw = PowerDrawAnalyzer(
+            BaseClimateControl.power_draw_window,
+            BaseClimateControl.compressor_running_draw_threshold,
+            self.compressor_low_draw_threshold
+        )
+
+        # Everything a control tick reads, kept current by state-change events
+        self.tick_input_ents = [
+            BaseClimateControl.ac_power_draw_ent,
+            self.get_temp_ent(TempSensorsLocation.OUTSIDE_FOREST_SIDE),
+        ] + [
+            ent
+            for zone in self.zones
+            for ent in (zone.temp_ent, zone.target_ent)
+        ]
 
+        # Set when a tick input changes, used by the event trigger mode
+        self.tick_requested = asyncio.Event()
 
-    async def on_init_done(self):
+        # Only sensors report regularly, a target can go unchanged for days without being stale
+        sensor_ents = [BaseClimateControl.ac_power_draw_ent, self.get_temp_ent(TempSensorsLocation.OUTSIDE_FOREST_SIDE)]
+        sensor_ents += [zone.temp_ent for zone in self.zones]
+        target_ents = [zone.target_ent for zone in self.zones]
 
-        if await self.get_is_active():
-            self.start_by_task()
+        await self.cache_entities([self.is_active_ent] + target_ents, snapshot=self.settings.snapshot)
+        await self.cache_entities(sensor_ents, max_age=BaseClimateControl.state_cache_max_age, snapshot=self.settings.snapshot)
+
+        # Inputs of the running tick, read once at the start of the tick
+        self.tick_inputs = {}
+        self.tick_timer = TickTimer()
+
+        self.add_power_draw_sample(self.get_cached_state(BaseClimateControl.ac_power_draw_ent))
 
-        self.listen_state(self.on_is_active_ent_change, self.is_active_ent)
-        self.listen_state(self.on_ac_power_draw_change, BaseClimateControl.ac_power_draw_ent)
+        # Commands are only sent when the device is not already in the requested state, and only
+        # by the controller owning the actuators, they are shared with the other controller
+        self.arbiter: ActuatorArbiter = get_arbiter()
+        self.arbiter.register(self)
+        self.actuator_token = None
 
+        actuator_ents = [
+            BaseClimateControl.ac_ent,
+            BaseClimateControl.ac_ext_fan_ent,
+            BaseClimateControl.bedroom_heater_ent,
+        ]
+        await self.cache_entities(actuator_ents, snapshot=self.settings.snapshot)
+
+        self.actuators = {
+            ent: Actuator(self, ent, BaseClimateControl.actuator_refresh_interval, self.arbiter)
+            for ent in actuator_ents
+        }
+
+        # Power draw samples arrive every few seconds, the external fan decision rarely changes
+        self.ac_ext_fan_evaluation = Coalescer(
+            self,
+            self.evaluate_ac_ext_fan,
+            key=lambda: (
+                self.state_cache.peek(self.is_active_ent),
+                self.is_cooling,
+                self.defrost_started_at is not None,
+                self.disable_external_ac_fan,
+            )
+        )
 
-    async def init_settings_members(self, settings_ents, sub_class_prefix=""):
 
-        for ent in settings_ents:
+    async def on_init_done(self):
 
-            attr = ent.split(sub_class_prefix+"climate_control_")[1]
-            val = await self.get_state(ent)
+        # Every setting is registered by now
+        self.settings.release_snapshot()
 
-            self.set_setting_attr(attr, val)
+        self.restore_state()
 
-            self.listen_state(self.on_setting_change, ent, attr_name=attr)
-            self.dev_log(attr, getattr(self, attr))
+        if await self.get_is_active():
+            self.start_by_task()
 
-    async def get_is_active(self):
-        return (await self.get_state(self.is_active_ent)) == "on"
+        # Both are cached already, the hub shares the subscriptions with the other controller
+        await self.hub.subscribe(self, self.is_active_ent, self.on_is_active_ent_change)
+        await self.hub.subscribe(self, BaseClimateControl.ac_power_draw_ent, self.on_ac_power_draw_change)
 
-    def on_setting_change(self, entity, attribute, old, new, kwargs):
-        attr = kwargs.get("attr_name")
 
-        if attr:
-            self.set_setting_attr(attr, new)
-            self.dev_log(f"Setting '{attr}' updated to", new)
+    async def get_is_active(self):
+        return (await self.read_state(self.is_active_ent)) == "on"
 
-    def set_setting_attr(self, attr, val):
-            
-        if attr.startswith("disable_"):
-            setattr(self, attr, val == "on")
-        elif attr.endswith("_time"):
-            setattr(self, attr, str(val))
-        else:
-            setattr(self, attr, float(val))
+    def on_low_draw_threshold_change(self, old, new):
+        self.power_draw.set_thresholds(BaseClimateControl.compressor_running_draw_threshold, new)
+        self.schedule_freeze_check()
+
+    def on_max_low_draw_duration_change(self, old, new):
+        self.schedule_freeze_check()
 
-    def on_is_active_ent_change(self, entity, attribute, old, new, kwargs):
-        self.dev_log(f"Is active change from '{old}' to '{new}'")
+    async def on_is_active_ent_change(self, entity, old, new):
+        self.dev_log("Is active change from '{old}' to '{new}'", old=old, new=new)
 
         if new == "on":
             self.start_by_task()
         else:
             self.stop()
 
-    async def on_ac_power_draw_change(self, entity, attribute, old, new, kwargs): 
+    async def on_ac_power_draw_change(self, entity, old, new): 
         
+        self.add_power_draw_sample(new)
+
+        self.dev_log("AC power draw change from '{old}' to '{new}'", old=old, new=new)
+        self.ac_ext_fan_evaluation.trigger()
+
+    async def evaluate_ac_ext_fan(self):
         if await self.get_is_active():
-            self.dev_log(f"AC power draw change from '{old}' to '{new}'")
-            self.create_task(self.handle_ac_ext_fan_operation_during_cooling())
+            await self.handle_ac_ext_fan_operation_during_cooling()
 
     def start_by_task(self):
         self.dev_log("Starting loop by task")
 
-        self.stop()
-        self.loops.add(self.create_task(self.start()))
+        # Replaces a running loop, after an error it is restarted with backoff unless debugging
+        self.tasks.start(
+            "climate_control",
+            self.run_climate_control,
+            restart=not self.debug,
+            min_backoff=BaseClimateControl.error_restart_interval,
+            on_error=self.on_climate_control_error
+        )
 
     def stop(self):
         self.dev_log("Stopping climate control")
+        self.tasks.cancel("climate_control")
+        self.cancel_freeze_check()
+        self.arbiter.release(self)
 
-        for loop in self.loops:
-            self.dev_log("Cancelling old loop", id(loop))
-            loop.cancel()
-
-        self.loops.clear()
+    def on_actuators_lost(self, taken_by):
+        """Called by the arbiter when the other controller acquired the actuators"""
+        self.info_log("Actuators taken over by {app}, stopping", app=taken_by.name)
+        self.stop()
 
-    async def start(self):
+    async def terminate(self):
+        self.state_store.flush(self.get_timestamp())
+        self.thermal_model_store.flush(self.get_timestamp())
+        self.tasks.cancel_all()
+        self.cancel_freeze_check()
+        self.decision_log.close()
+        self.arbiter.unregister(self)
+        await self.release_entities()
+
+    async def run_climate_control(self):
+        # A restart after an error only goes ahead while still active
+        if await self.get_is_active():
+            # Stops the other controller before anything is sent, its commands are refused from here on
+            self.actuator_token = self.arbiter.acquire(self, self.actuators)
+            await self.start()
 
-        self.current_defrosting_timer = 0
-        self.compressor_low_draw_timer = 0
+    def on_climate_control_error(self, e):
+        if not self.debug:
+            self.send_notification(f"An error happened: {e}")
 
-        self.dev_log("Starting climate control")
+    async def start(self):
 
-        try:
-            # Cleans up any heater state from sleep climate control
-            await self.set_bedroom_heater(OnOff.OFF)
-            await self.base_loop()
+        if self.is_resuming():
+            self.dev_log("Resuming with restored state")
+            self.resumed_state = False
+        else:
+            self.defrost_started_at = None
+            self.schedule_freeze_check()
 
-        except asyncio.CancelledError: 
-            return
-        except Exception as e:
-            self.log("Error caught:\n" + traceback.format_exc())
-
-            try: 
-                if(not self.debug):
-                    await self.send_notification(f"An error happened: {e}")
-                    self.log(f"Starting again in {BaseClimateControl.error_restart_interval} seconds....")
-                    await self.restart()
-            except:
-                self.log("Error caught in restart:\n" + traceback.format_exc())
-                if(not self.debug):
-                    await self.restart()
-
-    async def restart(self):
-        await self.sleep(BaseClimateControl.error_restart_interval)
+        self.info_log("Starting climate control")
 
-        if await self.get_is_active():
-            self.start_by_task()
+        # Cleans up any heater state from sleep climate control
+        await self.set_bedroom_heater(OnOff.OFF)
+        await self.base_loop()
 
     async def base_loop(self):
 
         while(await self.get_is_active()):
-            self.dev_log(f"\n=\n BASE LOOP ({id(self)})\n=")
-            await self.update_fan_runtime()
+            self.dev_log("\n=\n BASE LOOP ({app_id})\n=", app_id=id(self))
+
+            await self.run_tick()
+            await self.wait_for_next_tick()
+
+    async def run_tick(self):
+        self.tick_requested.clear()
+
+        self.tick_timer.start()
+        started_at = self.get_timestamp()
+        tick_inputs = self.tick_inputs = await self.get_states_snapshot(self.tick_input_ents)
+        self.tick_timer.mark("acquire")
+
+        try:
             await self.loop_logic()
+        finally:
+            self.tick_inputs = {}
+
+        # Subclasses mark "decide" in loop_logic, the rest of the tick is actuation
+        self.tick_timer.mark("actuate")
+
+        self.observe_thermal_model(started_at, tick_inputs)
+        self.log_decision(started_at, tick_inputs)
+        self.dev_log("Thermal model", self.thermal_model.summary)
+        self.dev_log("Tick timing", self.tick_timer.summary)
+        self.dev_log("State cache", self.state_cache.stats)
+        self.dev_log("Actuators", lambda: {ent: actuator.stats() for ent, actuator in self.actuators.items()})
+        self.dev_log("Actuator arbiter", self.arbiter.stats)
+        self.dev_log("Power draw events", self.ac_ext_fan_evaluation.stats)
+        self.dev_log("Notifications", self.notifications.stats)
+
+        self.save_state()
+
+    async def wait_for_next_tick(self):
+
+        if self.trigger_mode != "event":
             await self.sleep(self.polling_interval)
+            return
+
+        try:
+            await asyncio.wait_for(self.tick_requested.wait(), timeout=self.polling_interval)
+        except asyncio.TimeoutError:
+            self.dev_log("No input changes, watchdog tick")
+            return
+
+        # Lets a burst of changes settle into one tick
+        await self.sleep(self.trigger_debounce)
+
+    def on_state_cache_update(self, entity, old, new):
+        if old != new and entity in self.tick_input_ents:
+            self.tick_requested.set()
+
+    def save_state(self, force=False):
+        now = self.get_timestamp()
+
+        state = self.get_persisted_state()
+        state["saved_at"] = now
+
+        try:
+            self.state_store.save(state, now, force)
+        except Exception:
+            self.log("Error saving state snapshot:\n" + traceback.format_exc())
+
+    def restore_state(self):
+
+        try:
+            state = self.state_store.load()
+        except Exception:
+            self.log("Error loading state snapshot:\n" + traceback.format_exc())
+            return
+
+        if state is None:
+            return
+
+        age = self.get_timestamp() - state["saved_at"]
+
+        if not 0 <= age <= BaseClimateControl.state_max_age:
+            self.dev_log("State snapshot too old, not restoring. Age", age)
+            return
+
+        self.restore_persisted_state(state)
+        self.resumed_state = True
+        self.resumed_saved_at = state["saved_at"]
+
+        self.dev_log("Restored state snapshot", state)
+
+    def is_resuming(self):
+        """
+        True if start() keeps the restored state. The snapshot is only restored while recent,
+        an app inactive at init can start much later, so its age is checked again here.
+        """
+        if self.resumed_state and self.get_timestamp() - self.resumed_saved_at > BaseClimateControl.state_max_age:
+            self.dev_log("Restored state too old by the start, not resuming")
+            self.resumed_state = False
+
+        return self.resumed_state
+
+    def restore_thermal_model(self):
+
+        try:
+            data = self.thermal_model_store.load()
+        except Exception:
+            self.log("Error loading thermal model:\n" + traceback.format_exc())
+            return
+
+        if data is not None:
+            self.thermal_model.restore(data)
+
+    def observe_thermal_model(self, timestamp, tick_inputs):
+        """
+        Feeds the room temperatures read at the start of the tick to the thermal model,
+        with the AC mode and heater state the tick left them in.
+        """
+        try:
+            temps = {zone.name: float(tick_inputs[zone.temp_ent]) for zone in self.zones}
+            outdoor_temp = float(tick_inputs[self.get_temp_ent(TempSensorsLocation.OUTSIDE_FOREST_SIDE)])
+        except (KeyError, TypeError, ValueError):
+            # A sensor is unavailable, the next reading starts a new interval
+            self.thermal_model.last = None
+            return
+
+        ac_mode = self.actuators[BaseClimateControl.ac_ent].expected_state()
+        heater = self.actuators[BaseClimateControl.bedroom_heater_ent].expected_state() == OnOff.ON.value
+
+        if self.thermal_model.observe(timestamp, temps, outdoor_temp, ac_mode == ACModes.COOL.value, ac_mode == ACModes.FAN.value, heater):
+            try:
+                self.thermal_model_store.save(self.thermal_model.to_dict(), timestamp)
+            except Exception:
+                self.log("Error saving thermal model:\n" + traceback.format_exc())
+
+    def get_decision_columns(self):
+        columns = [("time", "d")]
+
+        for zone in self.zones:
+            columns += [(f"{zone.name}_temp", "f"), (f"{zone.name}_target", "f"), (f"{zone.name}_diff", "f")]
+
+        return columns + [
+            ("outdoor_temp", "f"),
+            ("power_draw", "f"),
+            ("ac_mode", "b"),           # index in ACModes
+            ("ac_ext_fan", "b"),
+            ("bedroom_heater", "b"),
+            ("defrost_seconds", "f"),   # into the current defrost cycle
+            ("low_draw_seconds", "f"),  # into the current low draw
+        ]
+
+    def log_decision(self, timestamp, tick_inputs):
+        """Appends the tick's inputs and the actuator states it left to the decision log"""
+
+        def number(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+
+        def on_off(ent):
+            state = self.actuators[ent].expected_state()
+            return 1 if state == OnOff.ON.value else 0 if state == OnOff.OFF.value else None
+
+        record = {"time": timestamp}
+
+        for zone in self.zones:
+            temp = number(tick_inputs.get(zone.temp_ent))
+            target = self.get_zone_target(zone, tick_inputs)
+
+            record[f"{zone.name}_temp"] = temp
+            record[f"{zone.name}_target"] = target
+            record[f"{zone.name}_diff"] = temp - target if temp is not None and target is not None else None
+
+        ac_modes = [mode.value for mode in ACModes]
+        ac_mode = self.actuators[BaseClimateControl.ac_ent].expected_state()
+        low_draw_since = self.power_draw.low_draw_since
+
+        record.update(
+            outdoor_temp=number(tick_inputs.get(self.get_temp_ent(TempSensorsLocation.OUTSIDE_FOREST_SIDE))),
+            power_draw=number(tick_inputs.get(BaseClimateControl.ac_power_draw_ent)),
+            ac_mode=ac_modes.index(ac_mode) if ac_mode in ac_modes else None,
+            ac_ext_fan=on_off(BaseClimateControl.ac_ext_fan_ent),
+            bedroom_heater=on_off(BaseClimateControl.bedroom_heater_ent),
+            defrost_seconds=timestamp - self.defrost_started_at if self.defrost_started_at is not None else None,
+            low_draw_seconds=timestamp - low_draw_since if low_draw_since is not None else None,
+        )
+
+        try:
+            self.decision_log.append(record)
+        except Exception:
+            self.log("Error writing decision log:\n" + traceback.format_exc())
+
+    def get_zone_target(self, zone, tick_inputs):
+        """The target the tick held the zone to, overridden by controllers with their own targets"""
+        try:
+            return float(tick_inputs.get(zone.target_ent))
+        except (TypeError, ValueError):
+            return None
+
+    async def get_predicted_too_warm_zone(self, diff_limit):
+        """
+        Returns the first zone and the seconds until the thermal model predicts it passes
+        its target by diff_limit without cooling, if that is within predictive_lead_time.
+        Reads the temperatures the zone table evaluated this tick.
+        """
+        if self.predictive_lead_time <= 0:
+            return None, None
+
+        table = self.zone_table
+        outdoor_temp = await self.get_temp(TempSensorsLocation.OUTSIDE_FOREST_SIDE)
+        heater = self.actuators[BaseClimateControl.bedroom_heater_ent].expected_state() == OnOff.ON.value
+
+        for i, zone in enumerate(table.zones):
+            seconds = self.thermal_model.seconds_until(zone.name, table.temps[i], table.targets[i] + diff_limit, outdoor_temp, heater=heater)
+
+            if seconds is not None and seconds <= self.predictive_lead_time:
+                return zone, seconds
+
+        return None, None
+
+    # Extended by subclasses, values must be JSON serializable
+    def get_persisted_state(self):
+        self.update_fan_runtime()
+
+        return {
+            "is_cooling": self.is_cooling,
+            "is_any_fans_active": self.is_any_fans_active,
+            "fan_runtime_mins_current_hour": self.fan_runtime_mins_current_hour,
+            "hour_start": self.get_hour_start_timestamp(),
+            "low_draw_since": self.power_draw.low_draw_since,
+            "defrost_started_at": self.defrost_started_at,
+        }
+
+    def restore_persisted_state(self, state):
+        self.is_cooling = state["is_cooling"]
+        self.is_any_fans_active = state["is_any_fans_active"]
+        # Timestamps, so the AC defrosting while AppDaemon was down counts towards the cycle
+        self.defrost_started_at = state["defrost_started_at"]
+
+        # A low draw now that was already going on at the snapshot started back then
+        if self.power_draw.low_draw_since is not None and state["low_draw_since"] is not None:
+            self.power_draw.low_draw_since = min(self.power_draw.low_draw_since, state["low_draw_since"])
+
+        self.schedule_freeze_check()
+
+        if state["hour_start"] == self.get_hour_start_timestamp():
+            self.fan_runtime.restore(state["fan_runtime_mins_current_hour"] * 60, self.is_any_fans_active, self.get_monotonic())
+        else:
+            self.fan_runtime.set_active(self.is_any_fans_active, self.get_monotonic())
+
+        self.update_fan_runtime()
 
     # Loop logic is implemented by subclasses
     async def loop_logic(self):
         return
+
+    async def read_tick_input(self, entity):
+        if entity in self.tick_inputs:
+            return self.tick_inputs[entity]
+
+        return await self.read_state(entity)
     
     
-    async def send_notification(self, msg):
-        await self.send_mobile_notification("Climate Control", msg)
+    def send_notification(self, msg):
+        self.send_mobile_notification("Climate Control", msg)
 
-    async def get_temp(self, sensor: TempSensorsLocation):
-        return float(await self.get_state(f"sensor.{sensor.value}{BaseClimateControl.temp_ent_ending}"))
+    def get_temp_ent(self, sensor: TempSensorsLocation):
+        return f"sensor.{sensor.value}{BaseClimateControl.temp_ent_ending}"
 
-    async def get_target_temp(self, area: TempSensorsLocation):
-        return float(await self.get_state(f"input_number.ordinary_climate_control_target_temp_{area.value}"))
+    async def get_temp(self, sensor: TempSensorsLocation):
+        return float(await self.read_tick_input(self.get_temp_ent(sensor)))
 
     async def set_ac_mode(self, mode: ACModes):
-        self.dev_log(f"AC mode -> {mode.value}")
-        await self.call_service("select/select_option", entity_id=BaseClimateControl.ac_ent, option=mode.value)
+        actuator = self.actuators[BaseClimateControl.ac_ent]
+
+        if await actuator.set(mode.value, "select/select_option", option=mode.value):
+            self.dev_log("AC mode -> {mode}", mode=mode.value)
 
     async def get_ac_current_power_draw(self):
-        return float(await self.get_state(BaseClimateControl.ac_power_draw_ent))
+        return float(await self.read_tick_input(BaseClimateControl.ac_power_draw_ent))
 
     async def set_ac_ext_fan(self, mode: OnOff):
-        self.dev_log(f"AC external fan -> {mode.value}")
-        await self.call_service(f"switch/turn_{mode.value}", entity_id=BaseClimateControl.ac_ext_fan_ent)
+        actuator = self.actuators[BaseClimateControl.ac_ext_fan_ent]
+
+        if await actuator.set(mode.value, f"switch/turn_{mode.value}"):
+            self.dev_log("AC external fan -> {mode}", mode=mode.value)
 
     async def set_bedroom_heater(self, mode: OnOff):
-        self.dev_log(f"Bedroom heater -> {mode.value}")
-        await self.call_service(f"switch/turn_{mode.value}", entity_id=BaseClimateControl.bedroom_heater_ent)
+        actuator = self.actuators[BaseClimateControl.bedroom_heater_ent]
+
+        if await actuator.set(mode.value, f"switch/turn_{mode.value}"):
+            self.dev_log("Bedroom heater -> {mode}", mode=mode.value)
 
     async def get_too_cold_for_compressor(self):
         outside_temp = await self.get_temp(TempSensorsLocation.OUTSIDE_FOREST_SIDE)
@@ -244,6 +621,7 @@ class BaseClimateControl(Support):
                 
                 await self.set_ac_mode(ACModes.FAN)
                 await self.set_ac_ext_fan(OnOff.ON)
+                self.set_fans_active(True)
                 return
 
             await self.set_ac_mode(ACModes.COOL)
@@ -257,13 +635,18 @@ class BaseClimateControl(Support):
         # Set external AC fan
         await self.handle_ac_ext_fan_operation_during_cooling()
 
-        self.is_any_fans_active = True
+        self.set_fans_active(True)
             
 
     async def stop_cooling(self):
         self.dev_log("stop_cooling")
 
-        self.dev_log(f"\nFan runtime this hour: {self.fan_runtime_mins_current_hour}\n Minimum fan runtime this hour: {self.min_time_fan_per_hour}")
+        self.update_fan_runtime()
+        self.dev_log(
+            "\nFan runtime this hour: {runtime}\n Minimum fan runtime this hour: {minimum}",
+            runtime=self.fan_runtime_mins_current_hour,
+            minimum=self.min_time_fan_per_hour
+        )
 
         self.is_cooling = False
 
@@ -271,31 +654,38 @@ class BaseClimateControl(Support):
             
             self.dev_log("Fan runtime this hour is less than minimum, keeping AC fan on.")
             await self.set_ac_mode(ACModes.FAN)
-            self.is_any_fans_active = True
+            self.set_fans_active(True)
 
         else:
             await self.set_ac_mode(ACModes.OFF)
-            self.is_any_fans_active = False
+            self.set_fans_active(False)
 
         await self.set_ac_ext_fan(OnOff.OFF)
 
     
-    async def update_fan_runtime(self):
+    def set_fans_active(self, active):
+        self.is_any_fans_active = active
+        self.fan_runtime.set_active(active, self.get_monotonic())
+
+    def get_hour_start_timestamp(self):
+        return self.get_datetime_in_local_time().replace(minute=0, second=0, microsecond=0).timestamp()
 
-        current_hour = (await self.datetime()).hour
+    def update_fan_runtime(self):
+        """
+        Sets fan_runtime_mins_current_hour from the fan transitions since the start of the wall clock hour.
+        """
+        now = self.get_monotonic()
+        now_dt = self.get_datetime_in_local_time()
 
-        if current_hour != self.current_hour:
-            self.fan_runtime_mins_current_hour = 0
-            self.current_hour = current_hour
+        since_hour_start = (now_dt - now_dt.replace(minute=0, second=0, microsecond=0)).total_seconds()
 
-        if self.is_any_fans_active:
-             self.fan_runtime_mins_current_hour += self.polling_interval / 60
+        self.fan_runtime_mins_current_hour = self.fan_runtime.runtime_between(now - since_hour_start, now) / 60
 
     async def handle_ac_ext_fan_operation_during_cooling(self):
         self.dev_log("handle_ac_ext_fan_operation_during_cooling")
         
         # If currently in defrosting mode, no need to change external fan state
-        if self.current_defrosting_timer > 0:
+        if self.defrost_started_at is not None:
             self.dev_log("Defrosting in progress, do not changing external fan state")
             return
 
@@ -335,60 +725,101 @@ class BaseClimateControl(Support):
         # await self.set_ac_ext_fan(OnOff.OFF)
 
 
+    def add_power_draw_sample(self, state):
+        try:
+            watts = float(state)
+        except (TypeError, ValueError):
+            # unavailable or unknown
+            return
+
+        self.power_draw.add_sample(self.get_timestamp(), watts)
+        self.schedule_freeze_check()
+
+    def schedule_freeze_check(self):
+        """
+        Arms a check for the moment the current low draw has lasted compressor_max_low_draw_duration,
+        so a freeze is caught when it happens even if the sensor reports nothing new.
+        """
+        self.cancel_freeze_check()
+
+        low_draw_since = self.power_draw.low_draw_since
+
+        if low_draw_since is None or self.defrost_started_at is not None:
+            return
+
+        delay = max(0.0, low_draw_since + self.compressor_max_low_draw_duration - self.get_timestamp())
+        self.freeze_check_timer = asyncio.get_running_loop().call_later(delay, self.on_freeze_check_timer)
+
+    def cancel_freeze_check(self):
+        if self.freeze_check_timer is not None:
+            self.freeze_check_timer.cancel()
+            self.freeze_check_timer = None
+
+    def on_freeze_check_timer(self):
+        self.freeze_check_timer = None
+
+        # Power draw changes keep arming the check while stopped, and after terminate
+        if not self.tasks.is_running("climate_control"):
+            return
+
+        self.tasks.start("freeze_onset", self.handle_freeze_onset, restart=False)
+
+    async def handle_freeze_onset(self):
+
+        if self.defrost_started_at is not None or not self.is_cooling:
+            return
+
+        if not self.power_draw.is_freeze_onset(self.get_timestamp(), self.compressor_max_low_draw_duration):
+            return
+
+        if not await self.get_is_active():
+            return
+
+        await self.start_defrost()
+
+        self.dev_log("Radiator freeze detected, starting fans mode.")
+        await self.set_ac_mode(ACModes.FAN)
+        await self.set_ac_ext_fan(OnOff.ON)
+        self.set_fans_active(True)
+
+    async def start_defrost(self):
+        self.info_log("Low draw duration exceeded, might have freezed over, starting defrost")
+
+        self.defrost_started_at = self.get_timestamp()
+        self.schedule_freeze_check()
+        self.save_state(force=True)
+
+        if not self.disable_freeze_warnings:
+            self.send_notification("Radiator freeze detected, starting defrosting cycle.")
+
     async def check_for_radiator_freeze(self) -> bool:
         self.dev_log("check_for_radiator_freeze")
 
-        # Currently in defrost mode
-        if self.current_defrosting_timer > 0:
-            self.dev_log("Defrost active, defrosting cycle duration", {self.defrost_cycle_duration * 60})
+        now = self.get_timestamp()
 
-            self.current_defrosting_timer += self.polling_interval
-            self.dev_log("Current defrosting timer", self.current_defrosting_timer)
+        # Currently in defrost mode
+        if self.defrost_started_at is not None:
+            self.dev_log("Defrost active, defrosting cycle duration", self.defrost_cycle_duration * 60)
+            self.dev_log("Defrosting for", now - self.defrost_started_at)
 
             # Defrosting complete
-            if self.current_defrosting_timer > self.defrost_cycle_duration * 60:
+            if now - self.defrost_started_at > self.defrost_cycle_duration * 60:
                 self.dev_log("Defrosting complete")
-                self.current_defrosting_timer = 0
-                return False
-            
-            self.dev_log("Defrosting in progress")
-            return True
-
-        else:
-            ac_watt = await self.get_ac_current_power_draw()
-            self.dev_log("AC current power draw", ac_watt)
+                self.defrost_started_at = None
 
-            # Compressor running normally
-            if ac_watt >= self.compressor_low_draw_threshold:
-                self.dev_log("Compressor draw above threshold")
-                self.compressor_low_draw_timer = 0
+                # A draw that is still low after the defrost starts a new low draw period
+                self.power_draw.restart_low_draw(now)
+                self.schedule_freeze_check()
                 return False
 
-            # Compressor not running
-            if ac_watt <= BaseClimateControl.compressor_running_draw_threshold:
-                self.dev_log("Compressor not running")
-                self.compressor_low_draw_timer = 0
-                return False
-
-            # Compressor low draw detected
-            if ac_watt <= self.compressor_low_draw_threshold:
-                self.dev_log("Compressor low draw detected, adding to timer")
-
-                self.compressor_low_draw_timer += self.polling_interval
-                self.dev_log("Compressor low draw timer", self.compressor_low_draw_timer)
-
-                # Low draw timer exceeded, start defrosting
-                if self.compressor_low_draw_timer > self.compressor_max_low_draw_duration:
-                    self.dev_log("Low draw duration exceeded, might have freezed over, starting defrost")
+            self.dev_log("Defrosting in progress")
+            return True
 
-                    self.compressor_low_draw_timer = 0
-                    self.current_defrosting_timer = 1 # activate defrosting
+        self.dev_log("Power draw", lambda: self.power_draw.stats(now))
 
-                    if not self.disable_freeze_warnings:
-                        await self.send_notification("Radiator freeze detected, starting defrosting cycle.")
-                    return await self.check_for_radiator_freeze()
-                
-                self.dev_log("Compressor low draw timer not exceeded")
-                return False              
+        # Usually handled by the freeze check timer already, unless this tick got there first
+        if self.power_draw.is_freeze_onset(now, self.compressor_max_low_draw_duration):
+            await self.start_defrost()
+            return True
 
-        raise Exception(f"check_for_radiator_freeze > unhandled case, ac power draw: {ac_watt}")
\ No newline at end of file
+        return False
@@ -1,25 +1,6 @@
-from enum import Enum
-from base_climate_control import BaseClimateControl, TempSensorsLocation, OnOff
-from dataclasses import dataclass, field
-from typing import Optional, cast
-
-class TempWarningType(Enum):
-	WARM = 0
-	COLD = 1
-
-@dataclass
-class TempWarningTrackerArea:
-	last_warning_sent: Optional[int] = None #timestamp
-	temp_normalized_after_last_warning: bool = True
-
-@dataclass
-class TempWarningTracker:
-	bedroom: 		TempWarningTrackerArea = field(default_factory=TempWarningTrackerArea)
-	office: 		TempWarningTrackerArea = field(default_factory=TempWarningTrackerArea)
-	living_room: 	TempWarningTrackerArea = field(default_factory=TempWarningTrackerArea)
-
-def get_tracker_area(tracker: TempWarningTracker, area: TempSensorsLocation):
-	return cast(TempWarningTrackerArea, getattr(tracker, area.value))
+from base_climate_control import BaseClimateControl, OnOff
+from settings_registry import Setting, parse_bool
+from zones import Zone
 
 class OrdinaryClimateControl(BaseClimateControl):
 
@@ -27,17 +8,6 @@ class OrdinaryClimateControl(BaseClimateControl):
 
 		await super().initialize()
 
-		# NOTE time input needs to end with _time for the conversions to work
-		settings_ents = [
-            "input_number.ordinary_climate_control_variability_threshold",
-            "input_number.ordinary_climate_control_temp_warning_threshold_cold",
-			"input_number.ordinary_climate_control_temp_warning_threshold_warm",
-            "input_number.ordinary_climate_control_repeated_warnings_block_timer",
-			"input_boolean.ordinary_climate_control_disable_temp_warnings",
-			
-			# Overrides the base class
-            "input_number.ordinary_climate_control_min_time_fan_per_hour",
-        ]
 		self.variability_threshold 			= None
 		self.temp_warning_threshold_cold 	= None
 		self.temp_warning_threshold_warm 	= None
@@ -46,51 +16,75 @@ class OrdinaryClimateControl(BaseClimateControl):
 
 		# Overrides base class
 		self.min_time_fan_per_hour	= None
-	
-		self.cold_temp_warning_tracker = TempWarningTracker()
-		self.warm_temp_warning_tracker = TempWarningTracker()
 
-		await self.init_settings_members(settings_ents, "ordinary_")
+		await self.settings.register([
+			Setting("input_number.ordinary_climate_control_variability_threshold",			"variability_threshold"),
+			Setting("input_number.ordinary_climate_control_temp_warning_threshold_cold",	"temp_warning_threshold_cold"),
+			Setting("input_number.ordinary_climate_control_temp_warning_threshold_warm",	"temp_warning_threshold_warm"),
+			Setting("input_number.ordinary_climate_control_repeated_warnings_block_timer",	"repeated_warnings_block_timer"),
+			Setting("input_boolean.ordinary_climate_control_disable_temp_warnings",		"disable_temp_warnings", parse_bool),
+
+			# Overrides the base class
+			Setting("input_number.ordinary_climate_control_min_time_fan_per_hour",			"min_time_fan_per_hour"),
+		])
 
 		await self.on_init_done()
 
 
 	async def start(self):
+		# The sleep controller has already been stopped by taking over the actuators
 		await self.call_service("input_boolean/turn_off", entity_id="input_boolean.sleep_climate_control")
-		await self.sleep(2)
 		await super().start()
 
 
-	async def loop_logic(self):
+	def get_persisted_state(self):
+		state = super().get_persisted_state()
 
-		rooms = [
-			TempSensorsLocation.BEDROOM,
-			TempSensorsLocation.OFFICE,
-			TempSensorsLocation.LIVING_ROOM
-		]
+		state["temp_warnings"] = self.zone_table.get_warning_state()
 
-		diffs = []
-		for room in rooms:
+		return state
 
-			roomDiff = await self.get_diff_temp_in_room(room)
 
-			if abs(roomDiff) < self.variability_threshold:
-				get_tracker_area(self.warm_temp_warning_tracker, room).temp_normalized_after_last_warning = True
-				get_tracker_area(self.cold_temp_warning_tracker, room).temp_normalized_after_last_warning = True
+	def restore_persisted_state(self, state):
+		super().restore_persisted_state(state)
 
-			diffs.append(roomDiff)
+		self.zone_table.restore_warning_state(state["temp_warnings"])
 
-		highest_diff_index = 0
-		for i in range(1, len(diffs)):
-			if diffs[i] > diffs[highest_diff_index]:
-				highest_diff_index = i
 
-		warmest_room = rooms[highest_diff_index]
-		warmest_rooms_diff = diffs[highest_diff_index]
+	async def loop_logic(self):
 
-		self.dev_log(f"Warmest room {warmest_room.value} | Diff: {round(warmest_rooms_diff, 2)}")
+		table = self.zone_table
+
+		# One pass over the zones on the tick snapshot, no Home Assistant reads here
+		warmest, warnings = table.evaluate(
+			self.tick_inputs,
+			self.get_timestamp(),
+			self.variability_threshold,
+			self.temp_warning_threshold_warm,
+			self.temp_warning_threshold_cold,
+			self.repeated_warnings_block_timer,
+			not self.disable_temp_warnings
+		)
+
+		warmest_rooms_diff = table.diffs[warmest]
+
+		self.dev_log("Zones", table.summary)
+		self.dev_log("Warmest room {room} | Diff: {diff:.2f}", room=table.zones[warmest].name, diff=warmest_rooms_diff)
+
+		self.tick_timer.mark("decide")
+
+		for i, is_warm in warnings:
+			self.send_temp_warning(table.zones[i], is_warm, table.targets[i], table.temps[i])
 
 		if abs(warmest_rooms_diff) < self.variability_threshold:
+
+			# Cooling early keeps the bursts short, and keeps going until the room is ahead again
+			zone, seconds = await self.get_predicted_too_warm_zone(self.variability_threshold)
+			if zone is not None:
+				self.dev_log("Room {room} predicted too hot in {seconds:.0f} s", room=zone.name, seconds=seconds)
+				await self.start_cooling()
+				return
+
 			self.dev_log("Warmest room within variability threshold")
 			await self.stop_cooling()
 			await self.set_bedroom_heater(OnOff.OFF)
@@ -106,72 +100,11 @@ class OrdinaryClimateControl(BaseClimateControl):
 			# Do not touch the heater, allowing it to heat if temp is lower than target
 
 
-	async def get_diff_temp_in_room(self, area: TempSensorsLocation):
+	def send_temp_warning(self, zone: Zone, is_warm, target_temp, current_temp):
 
-		target_temp = await self.get_target_temp(area)
-		current_temp = await self.get_temp(area)
+		temp_info = f"-> {zone.name} \n Current: {round(current_temp, 2)} | Target: {round(target_temp, 2)} | Diff: {round((current_temp - target_temp), 2)}"
 
-		diff = current_temp - target_temp
-		abs_temp_diff = abs(diff)
-
-		self.dev_log(f"ROOM = {area.value} | Current temp: {round(current_temp, 2)}\nTarget temp: {round(target_temp, 2)} | Diff: {round(diff, 2)}")
-
-		# Too warm
-		if(
-			diff > 0 and
-			abs_temp_diff > self.temp_warning_threshold_warm
-		):
-			await self.send_temp_warning(TempWarningType.WARM, area,  target_temp, current_temp)
-
-		# Too cold
-		elif(
-			diff < 0 and
-			abs_temp_diff > self.temp_warning_threshold_cold
-		):
-			await self.send_temp_warning(TempWarningType.COLD, area, target_temp, current_temp)
-
-		return diff
-
-
-	async def send_temp_warning(self, type: TempWarningType, area: TempSensorsLocation, target_temp, current_temp):
-
-		if(self.disable_temp_warnings):
-			return
-		
-		coolTracker: TempWarningTrackerArea = getattr(self.cold_temp_warning_tracker, area.value)
-		warmTracker: TempWarningTrackerArea = getattr(self.warm_temp_warning_tracker, area.value)
-
-		tracker: TempWarningTrackerArea
-		
-		if(type == TempWarningType.COLD):
-			tracker: TempWarningTrackerArea = coolTracker
-			warmTracker.temp_normalized_after_last_warning = True
+		if(is_warm):
+			self.send_notification(f"WARM WARNING {temp_info}")
 		else:
-			tracker: TempWarningTrackerArea = warmTracker
-			coolTracker.temp_normalized_after_last_warning = True
-
-		timestamp = self.get_timestamp_in_seconds()
-
-		seconds_since_last_warning = None
-		if(tracker.last_warning_sent != None):
-			
-			seconds_since_last_warning = timestamp - tracker.last_warning_sent
-
-			if(	seconds_since_last_warning < self.repeated_warnings_block_timer):
-				self.dev_log("Not enough time since last warning, time", seconds_since_last_warning)
-				return
-		
-		if(not tracker.temp_normalized_after_last_warning):
-			self.dev_log("Temp have not been normalized since last warning")
-			return
-
-		temp_info = f"-> {area.value} \n Current: {round(current_temp, 2)} | Target: {round(target_temp, 2)} | Diff: {round((current_temp - target_temp), 2)}"
-
-		if(type == TempWarningType.WARM):
-			await self.send_notification(f"WARM WARNING {temp_info}")
-
-		if(type == TempWarningType.COLD):
-			await self.send_notification(f"COLD WARNING {temp_info}")
-
-		tracker.last_warning_sent = timestamp
-		tracker.temp_normalized_after_last_warning = False
+			self.send_notification(f"COLD WARNING {temp_info}")
@@ -1,10 +1,14 @@
+import asyncio
 from base_climate_control import BaseClimateControl, OnOff, TempSensorsLocation
+from settings_registry import Setting, parse_bool, parse_time
 from datetime import datetime, time, timedelta
 
 class SleepClimateControl(BaseClimateControl):
 
     next_alarm_time_ent = "sensor.robins_oneplus_13_next_alarm"
     max_alarm_retries = 3
+    evening_start = time(18, 0) # the evening target applies from here until the warmup
+
 
     async def initialize(self):
 
@@ -16,31 +20,14 @@ class SleepClimateControl(BaseClimateControl):
         self.alarm_dt: datetime = None
         self.already_tried_getting_alarm = False
 
-        # NOTE time input needs to end with _time for the conversions to work
-        self.settings_ents = [
-            "input_number.sleep_climate_control_target_evening_temp",
-            "input_number.sleep_climate_control_target_morning_temp",
-            "input_number.sleep_climate_control_warmup_cycles",
-            "input_number.sleep_climate_control_variability_threshold",
-            "input_datetime.sleep_climate_control_warmup_weekdays_time",
-            "input_datetime.sleep_climate_control_warmup_weekend_time",
-            "input_datetime.sleep_climate_control_wakeup_weekdays_time",
-            "input_datetime.sleep_climate_control_wakeup_weekend_time",
-            "input_boolean.sleep_climate_control_disable_heater",
-            "input_boolean.sleep_climate_control_disable_alarm_wakeup",
-
-            # Overrides the base class
-            "input_number.sleep_climate_control_min_time_fan_per_hour",
-        ]
-        
-        # Entity-driven settings (overwritten by init_settings_members)
+        # Entity-driven settings (overwritten by the settings registry)
         self.target_evening_temp 	= None
         self.target_morning_temp 	= None
         self.warmup_cycles 			= None
-        self.warmup_weekdays_time 	= None # time from ha in hh:mm:ss format
-        self.warmup_weekend_time 	= None # time from ha in hh:mm:ss format
-        self.wakeup_weekdays_time 	= None # time from ha in hh:mm:ss format
-        self.wakeup_weekend_time 	= None # time from ha in hh:mm:ss format
+        self.warmup_weekdays_time 	= None # time
+        self.warmup_weekend_time 	= None # time
+        self.wakeup_weekdays_time 	= None # time
+        self.wakeup_weekend_time 	= None # time
         self.variability_threshold	= None
         self.disable_heater     	= None
         self.disable_alarm_wakeup   = None
@@ -48,47 +35,105 @@ class SleepClimateControl(BaseClimateControl):
         # Overrides base class
         self.min_time_fan_per_hour	= None
 
-        await self.init_settings_members(self.settings_ents, "sleep_")
+        # (datetime, target) steps of the night, compiled by compile_warmup_schedule
+        self.warmup_schedule: list[tuple[datetime, float]] = None
+        self.warmup_schedule_expires_at: datetime = None
+        self.warmup_schedule_timers = []
+        self.warmup_schedule_lock = asyncio.Lock()
+        self.scheduled_target = None
+
+        # The warmup schedule is compiled from these, except the last three
+        on_change = self.on_warmup_setting_change
+        await self.settings.register([
+            Setting("input_number.sleep_climate_control_target_evening_temp",       "target_evening_temp",  on_change=on_change),
+            Setting("input_number.sleep_climate_control_target_morning_temp",       "target_morning_temp",  on_change=on_change),
+            Setting("input_number.sleep_climate_control_warmup_cycles",             "warmup_cycles",        on_change=on_change),
+            Setting("input_datetime.sleep_climate_control_warmup_weekdays_time",    "warmup_weekdays_time", parse_time, on_change),
+            Setting("input_datetime.sleep_climate_control_warmup_weekend_time",     "warmup_weekend_time",  parse_time, on_change),
+            Setting("input_datetime.sleep_climate_control_wakeup_weekdays_time",    "wakeup_weekdays_time", parse_time, on_change),
+            Setting("input_datetime.sleep_climate_control_wakeup_weekend_time",     "wakeup_weekend_time",  parse_time, on_change),
+            Setting("input_boolean.sleep_climate_control_disable_alarm_wakeup",     "disable_alarm_wakeup", parse_bool, on_change),
+            Setting("input_number.sleep_climate_control_variability_threshold",     "variability_threshold"),
+            Setting("input_boolean.sleep_climate_control_disable_heater",           "disable_heater",       parse_bool),
+
+            # Overrides the base class
+            Setting("input_number.sleep_climate_control_min_time_fan_per_hour",     "min_time_fan_per_hour"),
+        ])
+
+        self.listen_state(self.on_next_alarm_change, SleepClimateControl.next_alarm_time_ent)
 
         await self.on_init_done()
 
 
     async def start(self):
 
-        self.alarm_dt = None
-        self.already_tried_getting_alarm = False
+        # super().start() clears resumed_state
+        if not self.is_resuming():
+            self.alarm_dt = None
+            self.already_tried_getting_alarm = False
 
+        # The ordinary controller has already been stopped by taking over the actuators
         await self.call_service("input_boolean/turn_off", entity_id="input_boolean.ordinary_climate_control")
-        await self.sleep(2) 
         await super().start()
 
 
+    def stop(self):
+        super().stop()
+
+        # Compiled again by the first tick after a start
+        self.clear_warmup_schedule()
+
+
+    def get_persisted_state(self):
+        state = super().get_persisted_state()
+
+        state["alarm_dt"] = self.alarm_dt.isoformat() if self.alarm_dt is not None else None
+        state["already_tried_getting_alarm"] = self.already_tried_getting_alarm
+
+        return state
+
+
+    def restore_persisted_state(self, state):
+        super().restore_persisted_state(state)
+
+        # An alarm that has already passed is fetched again
+        if state["alarm_dt"] is not None:
+            alarm_dt = datetime.fromisoformat(state["alarm_dt"])
+
+            if alarm_dt > self.get_datetime_in_local_time():
+                self.alarm_dt = alarm_dt
+                self.already_tried_getting_alarm = state["already_tried_getting_alarm"]
+
+
     async def loop_logic(self):
         self.dev_log("loop_logic")
 
         bedroom_temp = await self.get_temp(TempSensorsLocation.BEDROOM)
 
-        now_time = self.get_datetime_in_local_time().time()
-        warmup_time = self.get_warmup_time()
+        if self.warmup_schedule is None:
+            await self.compile_warmup_schedule()
 
-        self.dev_log(f"Current time: {now_time}, Warmup time: {warmup_time}")
+        # Switched at the step boundaries by the warmup schedule timers
+        target = self.scheduled_target
+        self.dev_log("Scheduled target", target)
 
-        if now_time >= time(18, 0) or now_time < warmup_time:
-        # Before warmup time
-            self.dev_log("Before warmup time, using evening target temp.")
-            await self.handle_cooling_or_heating(bedroom_temp, self.target_evening_temp)
-            return
+        self.tick_timer.mark("decide")
 
-        # Warmup time
-        self.dev_log("Warmup time started, using morning target temp.")
+        await self.handle_cooling_or_heating(bedroom_temp, target)
 
-        await self.handle_cooling_or_heating(bedroom_temp, await self.calculate_warmup_target())
+
+    def get_zone_target(self, zone, tick_inputs):
+        # Only the bedroom is controlled, to the scheduled target
+        if zone.temp_ent == self.get_temp_ent(TempSensorsLocation.BEDROOM):
+            return self.scheduled_target
+
+        return super().get_zone_target(zone, tick_inputs)
 
 
     async def handle_cooling_or_heating(self, current, target):
 
         diff = current - target
-        self.dev_log(f"Temp: {current}, Target: {target}, Diff: {round(diff, 2)}")
+        self.dev_log("Temp: {current}, Target: {target}, Diff: {diff:.2f}", current=current, target=target, diff=diff)
 
         if abs(diff) < self.variability_threshold:
             self.dev_log("Within variability threshold")
@@ -110,71 +155,153 @@ class SleepClimateControl(BaseClimateControl):
             await self.set_bedroom_heater(OnOff.ON)
 
 
-    async def calculate_warmup_target(self):
+    async def compile_warmup_schedule(self):
+        """
+        Compiles the targets of the night into (datetime, target) steps, the evening target
+        followed by warmup_cycles steps up to the morning target at the wakeup time, and
+        schedules a switch at each step.
 
-        wakeup_time = await self.get_wakeup_time()
-        now_dt = self.get_datetime_in_local_time()
+        While the alarm is still to be fetched the schedule ends at the warmup start, the phone
+        only reports the next alarm reliably once it is close. Otherwise it ends at the next
+        evening start. Either way it is then compiled again.
+        """
+        async with self.warmup_schedule_lock:
+            self.clear_warmup_schedule()
 
-        if now_dt >= wakeup_time:
-            # If the current time is past the alarm time, return the morning target temperature
-            self.dev_log("Current time is past the alarm time, returning morning target temperature.")
-            return self.target_morning_temp
-        
-        # Create a datetime object for the start of the warmup period.
-        # Use the date from now and the time from warmup_time (string "HH:MM:SS").
-        warmup_time_t = self.get_warmup_time()
-        # Use the timezone from now_dt to localize the start_time_dt
-        start_time_dt = datetime.combine(now_dt.date(), warmup_time_t).replace(tzinfo=now_dt.tzinfo)
+            now_dt = self.get_datetime_in_local_time()
 
-        # Calculate total warmup duration in seconds
-        warmup_duration_s = (wakeup_time - start_time_dt).total_seconds()
+            # The morning the schedule leads up to
+            ramp_date = now_dt.date()
+            if now_dt.time() >= SleepClimateControl.evening_start:
+                ramp_date += timedelta(days=1)
 
-        # Check for warm-up span zero or negative (mis-config)
-        if warmup_duration_s <= 0:
-            return self.target_morning_temp
+            warmup_start_dt = datetime.combine(ramp_date, self.get_warmup_time(ramp_date)).replace(tzinfo=now_dt.tzinfo)
+            evening_start_dt = datetime.combine(ramp_date, SleepClimateControl.evening_start).replace(tzinfo=now_dt.tzinfo)
 
-        # Calculate elapsed time as a fraction of the warmup duration
-        elapsed_time_fraction = (now_dt - start_time_dt).total_seconds() / warmup_duration_s
-        # keep it inside [0, 1] 
-        elapsed_time_fraction = max(0, min(1, elapsed_time_fraction))
+            steps = [(evening_start_dt - timedelta(days=1), self.target_evening_temp)]
 
-        # Determine which warmup cycle we are currently in
-        current_cycle = int(elapsed_time_fraction * self.warmup_cycles)
+            if now_dt < warmup_start_dt and self.is_alarm_pending():
+                expires_at = warmup_start_dt
+            else:
+                wakeup_dt = await self.get_wakeup_time(ramp_date)
+                steps += self.get_warmup_steps(warmup_start_dt, wakeup_dt)
+                expires_at = evening_start_dt
+
+            self.warmup_schedule = steps
+            self.warmup_schedule_expires_at = expires_at
+            self.scheduled_target = next(target for step_dt, target in reversed(steps) if step_dt <= now_dt)
+
+            for step_dt, target in steps:
+                if step_dt > now_dt:
+                    self.warmup_schedule_timers.append(await self.run_at(self.on_warmup_step, step_dt, target=target))
+
+            self.warmup_schedule_timers.append(await self.run_at(self.on_warmup_schedule_expired, expires_at))
 
-        # Calculate the total temperature difference to achieve during warmup
+        self.dev_log("Warmup schedule", self.get_warmup_schedule_summary)
+        await self.publish_warmup_schedule()
+
+
+    def get_warmup_steps(self, warmup_start_dt, wakeup_dt):
+        """
+        The target rises by an equal share at warmup_cycles evenly spaced steps between the
+        warmup start and the wakeup, and is the morning target from the wakeup on.
+        """
+        cycles = max(1, int(self.warmup_cycles))
         temp_diff = self.target_morning_temp - self.target_evening_temp
+        warmup_duration_s = (wakeup_dt - warmup_start_dt).total_seconds()
+
+        steps = []
+
+        # A wakeup at or before the warmup start (mis-config) goes straight to the morning target
+        if warmup_duration_s > 0:
+            for cycle in range(cycles):
+                steps.append((
+                    warmup_start_dt + timedelta(seconds=warmup_duration_s * cycle / cycles),
+                    self.target_evening_temp + temp_diff * cycle / cycles
+                ))
 
-        # Calculate the fraction of cycles completed
-        cycle_fraction = current_cycle / self.warmup_cycles
-        # Ensure cycle_fraction is between 0 and 1
-        cycle_fraction = min(1, cycle_fraction)
-
-        # Calculate the temperature increase for the current cycle
-        cycle_temp_increase = temp_diff * cycle_fraction
-
-        target_temp = self.target_evening_temp + cycle_temp_increase
-
-        self.dev_log(
-            f"Warmup calculation steps:\n"
-            f"  alarm_date: {self.alarm_dt}\n"
-            f"  start_time_date: {start_time_dt}\n"
-            f"  warmup_duration_s: {warmup_duration_s}\n"
-            f"  elapsed_time_fraction: {elapsed_time_fraction}\n"
-            f"  warmup_cycles: {self.warmup_cycles}\n"
-            f"  current_cycle: {current_cycle}\n"
-            f"  temp_diff: {temp_diff}\n"
-            f"  cycle_fraction: {cycle_fraction}\n"
-            f"  cycle_temp_increase: {cycle_temp_increase}\n"
-            f"  target_temp: {target_temp}\n"
+        steps.append((max(wakeup_dt, warmup_start_dt), self.target_morning_temp))
+        return steps
+
+
+    def clear_warmup_schedule(self):
+        for handle in self.warmup_schedule_timers:
+            self.cancel_timer(handle)
+
+        self.warmup_schedule_timers = []
+        self.warmup_schedule = None
+
+
+    async def recompile_warmup_schedule(self):
+        await self.compile_warmup_schedule()
+        self.tick_requested.set()
+
+
+    async def on_warmup_step(self, kwargs):
+        self.scheduled_target = kwargs["target"]
+        self.dev_log("Warmup step, target", self.scheduled_target)
+
+        self.tick_requested.set()
+        await self.publish_warmup_schedule()
+
+
+    async def on_warmup_schedule_expired(self, kwargs):
+        self.warmup_schedule_timers = []
+
+        if await self.get_is_active():
+            await self.recompile_warmup_schedule()
+        else:
+            self.warmup_schedule = None
+
+
+    async def on_warmup_setting_change(self, old, new):
+        if self.warmup_schedule is not None:
+            await self.recompile_warmup_schedule()
+
+
+    async def on_next_alarm_change(self, entity, attribute, old, new, kwargs):
+
+        if old == new or self.warmup_schedule is None or self.disable_alarm_wakeup:
+            return
+
+        # Only an alarm already in use that is still ahead is fetched again, with the same checks.
+        # The phone moves the next alarm to the following day when it rings.
+        if self.alarm_dt is None or self.alarm_dt <= self.get_datetime_in_local_time():
+            return
+
+        self.dev_log("Next alarm changed to", new)
+        self.alarm_dt = None
+        self.already_tried_getting_alarm = False
+
+        await self.recompile_warmup_schedule()
+
+
+    def get_warmup_schedule_summary(self):
+        return {
+            "steps": [(step_dt.isoformat(), round(target, 2)) for step_dt, target in self.warmup_schedule or []],
+            "expires_at": self.warmup_schedule_expires_at.isoformat() if self.warmup_schedule_expires_at else None,
+            "alarm": self.alarm_dt.isoformat() if self.alarm_dt is not None else None,
+        }
+
+
+    async def publish_warmup_schedule(self):
+        """Publishes the current target as sensor.<app>_warmup_schedule with the steps as attributes"""
+
+        await self.set_state(
+            f"sensor.{self.name}_warmup_schedule",
+            state=self.scheduled_target,
+            attributes=dict(self.get_warmup_schedule_summary(), friendly_name=f"{self.name} warmup schedule")
         )
 
-        return target_temp
+
+    def is_alarm_pending(self):
+        return not self.disable_alarm_wakeup and self.alarm_dt is None and not self.already_tried_getting_alarm
 
 
-    async def get_wakeup_time(self):
+    async def get_wakeup_time(self, ramp_date):
 
         if(not self.disable_alarm_wakeup):
-            if self.alarm_dt is None and not self.already_tried_getting_alarm:
+            if self.is_alarm_pending():
                 await self.update_alarm_dt()
                 self.already_tried_getting_alarm = True
                 return self.alarm_dt
@@ -182,18 +309,17 @@ class SleepClimateControl(BaseClimateControl):
             if self.alarm_dt is not None:
                 return self.alarm_dt
 
-        if self.is_weekend():
-            return self.get_datetime_from_ha_time_input(self.wakeup_weekend_time)
-        else:
-            return self.get_datetime_from_ha_time_input(self.wakeup_weekdays_time)
+        wakeup_time = self.wakeup_weekend_time if self.is_weekend(ramp_date) else self.wakeup_weekdays_time
+
+        return datetime.combine(ramp_date, wakeup_time).replace(tzinfo=self.get_datetime_in_local_time().tzinfo)
 
 
-    def get_warmup_time(self):
+    def get_warmup_time(self, dt=None):
 
-        if(self.is_weekend()):
-            return self.get_time_from_ha_time_input(self.warmup_weekend_time)
+        if(self.is_weekend(dt)):
+            return self.warmup_weekend_time
         else:
-            return self.get_time_from_ha_time_input(self.warmup_weekdays_time)
+            return self.warmup_weekdays_time
         
 
     async def update_alarm_dt(self, retries = 0):
@@ -209,12 +335,11 @@ class SleepClimateControl(BaseClimateControl):
 
             # Determine which manual time to use
             if self.is_weekend():
-                fallback_time_str = self.wakeup_weekend_time
+                fallback_time = self.wakeup_weekend_time
             else:
-                fallback_time_str = self.wakeup_weekdays_time
+                fallback_time = self.wakeup_weekdays_time
             
-            # Use your existing helper to create the full datetime object
-            self.alarm_dt = self.get_datetime_from_ha_time_input(fallback_time_str)
+            self.alarm_dt = self.get_datetime_today_at(fallback_time)
             return
         
         alarm_string = await self.get_state(self.next_alarm_time_ent)
@@ -223,7 +348,7 @@ class SleepClimateControl(BaseClimateControl):
         if alarm_string == "unavailable":
 
             if retries == 0:
-                await self.send_mobile_notification("Sleep Climate Control", f"No alarm set, retrying {max_retries} times before using static set time.")
+                self.send_mobile_notification("Sleep Climate Control", f"No alarm set, retrying {max_retries} times before using static set time.")
 
             if retries < max_retries:
                 await self.sleep(5)
@@ -241,7 +366,7 @@ class SleepClimateControl(BaseClimateControl):
 
             self.dev_log("Alarm time is more than 8 hours away.")
             if retries == 0:
-                await self.send_mobile_notification("Sleep Climate Control", f"Alarm time is more than 8 hours away, retrying {max_retries} times before using static set time.")
+                self.send_mobile_notification("Sleep Climate Control", f"Alarm time is more than 8 hours away, retrying {max_retries} times before using static set time.")
 
             if retries < max_retries:
                 await self.sleep(5)
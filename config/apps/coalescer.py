@@ -0,0 +1,72 @@
+_NO_KEY = object()
+
+class Coalescer:
+    """
+    Collapses a burst of triggers into at most one running evaluation plus one pending re-run.
+
+    key is an optional callable returning everything the evaluation's decision depends on.
+    A trigger while nothing runs and the key equals the one of the last evaluation is
+    skipped, a trigger while an evaluation runs is merged into the pending re-run.
+    The evaluation runs as the task name of the app's supervisor, without restarts.
+    """
+
+    def __init__(self, app, evaluate, key=None, name=None):
+        self.app = app
+        self.evaluate = evaluate
+        self.key = key
+        self.name = name or evaluate.__name__
+
+        self.running = False
+        self.pending = False
+        self.last_key = _NO_KEY
+
+        self.triggers = 0
+        self.evaluations = 0
+        self.merged = 0
+        self.skipped = 0
+
+    def trigger(self):
+        self.triggers += 1
+
+        if self.running:
+            if self.pending:
+                self.merged += 1
+            self.pending = True
+            return
+
+        if self.key is not None and self.key() == self.last_key:
+            self.skipped += 1
+            return
+
+        self.running = True
+        self.app.tasks.start(self.name, self.run, restart=False)
+
+    async def run(self):
+        try:
+            while True:
+                self.pending = False
+                self.last_key = self.key() if self.key is not None else _NO_KEY
+                self.evaluations += 1
+
+                try:
+                    await self.evaluate()
+                except Exception:
+                    self.last_key = _NO_KEY
+                    raise
+
+                if not self.pending:
+                    break
+
+                if self.key is not None and self.key() == self.last_key:
+                    self.skipped += 1
+                    break
+        finally:
+            self.running = False
+
+    def stats(self):
+        return {
+            "triggers": self.triggers,
+            "evaluations": self.evaluations,
+            "merged": self.merged,
+            "skipped": self.skipped,
+        }
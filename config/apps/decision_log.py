@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import struct
+from array import array
+from bisect import bisect_left
+
+SCHEMA_FILE = "columns.json"
+MISSING = {"d": float("nan"), "f": float("nan"), "b": -1}
+
+class DecisionLog:
+    """
+    Append-only log of one fixed-width record per control tick, stored by column.
+
+    The log directory holds segments, each a directory named after the timestamp of its first
+    record, or one second after the previous segment if that is later. A segment has one file
+    per column of raw values in native byte order and the columns in columns.json. A record
+    adds itemsize bytes to every column file, so a column can be read with array.fromfile or
+    memory-mapped as is. A new segment starts every segment_duration seconds or when the
+    columns change, only the newest max_segments are kept.
+
+    columns is a list of (name, typecode) with typecodes "d", "f" (float, NaN when unknown)
+    and "b" (small int, -1 when unknown). Must be called from one thread.
+    """
+
+    def __init__(self, directory, columns, segment_duration, max_segments):
+        self.directory = directory
+        self.columns = [(name, typecode) for name, typecode in columns]
+        self.segment_duration = segment_duration
+        self.max_segments = max_segments
+
+        self.packers = [struct.Struct(typecode) for _, typecode in self.columns]
+
+        self.segment_start = None
+        self.files = None
+
+        self.records = 0
+
+    def append(self, record: dict):
+        """record holds a value per column, columns missing from it are written as unknown"""
+
+        timestamp = record["time"]
+
+        if self.files is None or timestamp - self.segment_start >= self.segment_duration:
+            self.open_segment(timestamp)
+
+        for (name, typecode), packer, f in zip(self.columns, self.packers, self.files):
+            value = record.get(name)
+            f.write(packer.pack(MISSING[typecode] if value is None else value))
+
+        self.records += 1
+
+    def open_segment(self, timestamp):
+        self.close()
+
+        segments = list_segments(self.directory)
+
+        # After a restart the last segment is continued while it is current and has the same columns
+        if segments and timestamp - int(segments[-1]) < self.segment_duration and read_columns(self.segment_path(segments[-1])) == self.columns:
+            name = segments[-1]
+            repair_segment(self.segment_path(name), self.columns)
+        else:
+            # Names only go up, so new columns within a second of the last segment get their own
+            name = str(max(int(timestamp), int(segments[-1]) + 1) if segments else int(timestamp))
+            path = self.segment_path(name)
+
+            existing = read_columns(path)
+            if existing is not None and existing != self.columns:
+                raise ValueError(f"Decision log segment {path} already holds other columns")
+
+            os.makedirs(path, exist_ok=True)
+
+            with open(os.path.join(path, SCHEMA_FILE), "w") as f:
+                json.dump({"columns": self.columns}, f)
+
+            segments.append(name)
+
+        for old in segments[:-self.max_segments]:
+            shutil.rmtree(self.segment_path(old), ignore_errors=True)
+
+        path = self.segment_path(name)
+        self.segment_start = int(name)
+        self.files = [open(os.path.join(path, f"{column}.bin"), "ab", buffering=0) for column, _ in self.columns]
+
+    def segment_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def close(self):
+        if self.files is not None:
+            for f in self.files:
+                f.close()
+
+        self.files = None
+
+    def stats(self):
+        return {
+            "records": self.records,
+            "segment": self.segment_start,
+        }
+
+def list_segments(directory):
+    """Segment names, oldest first"""
+
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    return sorted((name for name in names if name.isdigit()), key=int)
+
+def read_columns(path):
+
+    try:
+        with open(os.path.join(path, SCHEMA_FILE), "r") as f:
+            return [(name, typecode) for name, typecode in json.load(f)["columns"]]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+def count_records(path, columns):
+    """Complete records in the segment, a record cut short by a crash is not counted"""
+
+    def size(name):
+        try:
+            return os.path.getsize(os.path.join(path, f"{name}.bin"))
+        except FileNotFoundError:
+            return 0
+
+    return min(size(name) // array(typecode).itemsize for name, typecode in columns)
+
+def repair_segment(path, columns):
+    """Cuts every column back to the complete records, so appending keeps them aligned"""
+
+    count = count_records(path, columns)
+
+    for name, typecode in columns:
+        with open(os.path.join(path, f"{name}.bin"), "ab") as f:
+            f.truncate(count * array(typecode).itemsize)
+
+def load(directory, start=None, end=None) -> dict[str, array]:
+    """
+    Returns every column of the records with start <= time < end as an array, by column name.
+    A column missing from some segments is filled with its unknown value there.
+
+        columns = load("config/state/decision_log/ordinary_climate_control", start=time.time() - 30 * 86400)
+        cooling = sum(1 for mode in columns["ac_mode"] if mode == 1)
+    """
+    segments = []
+
+    names = list_segments(directory)
+    for i, name in enumerate(names):
+        # A segment ends where the next one starts
+        if end is not None and int(name) >= end:
+            break
+        if start is not None and i + 1 < len(names) and int(names[i + 1]) <= start:
+            continue
+
+        path = os.path.join(directory, name)
+        columns = read_columns(path)
+
+        if columns is not None:
+            segments.append((path, columns, count_records(path, columns)))
+
+    typecodes = {}
+    for _, columns, _ in segments:
+        for name, typecode in columns:
+            typecodes.setdefault(name, typecode)
+
+    result = {name: array(typecode) for name, typecode in typecodes.items()}
+
+    for path, columns, count in segments:
+        if count == 0:
+            continue
+
+        present = set()
+
+        for name, typecode in columns:
+            present.add(name)
+
+            with open(os.path.join(path, f"{name}.bin"), "rb") as f:
+                result[name].fromfile(f, count)
+
+        for name, typecode in typecodes.items():
+            if name not in present:
+                result[name].extend(array(typecode, [MISSING[typecode]]) * count)
+
+    if "time" in result and (start is not None or end is not None):
+        times = result["time"]
+        first = bisect_left(times, start) if start is not None else 0
+        last = bisect_left(times, end) if end is not None else len(times)
+
+        if first > 0 or last < len(times):
+            result = {name: values[first:last] for name, values in result.items()}
+
+    return result
@@ -0,0 +1,117 @@
+import asyncio
+import inspect
+import traceback
+from process_shared import ProcessShared
+
+class EntityHub:
+    """
+    One Home Assistant subscription and one cached state per entity for every app in the process.
+
+    Apps subscribe a callback to an entity, the callback is called with (entity, old, new) on
+    every state change. The same callback subscribed by several apps is called once and stays
+    subscribed while any of them holds it, so a shared consumer like the patrol coordinator
+    costs one call per change however many apps use it. Callback and memory cost are
+    O(entities), not O(apps x entities).
+
+    The upstream subscriptions belong to one of the registered apps, the owner. Apps unregister
+    in terminate, when the owner does the subscriptions move to the next app.
+    """
+
+    def __init__(self):
+        self.apps = {}              # app name -> app holding a subscription
+        self.owner = None
+        self.lock = asyncio.Lock()
+
+        self.handles = {}           # entity -> upstream listen_state handle
+        self.states = {}            # entity -> state
+        self.updated_at = {}        # entity -> timestamp of the last change
+        self.consumers = {}         # entity -> {callback: names of the apps holding it}
+
+    async def subscribe(self, app, entity, callback, snapshot=None):
+        """
+        Returns the current state. A new entity's state is read from snapshot, all states as
+        returned by get_state(), if given, so it can be as old as the snapshot.
+        """
+        async with self.lock:
+            self.apps[app.name] = app
+
+            if self.owner is None:
+                self.owner = app
+
+            if entity not in self.handles:
+                self.handles[entity] = await self.owner.listen_state(self.on_state_change, entity)
+
+                if snapshot is not None:
+                    state = snapshot.get(entity, {}).get("state")
+                else:
+                    state = await self.owner.get_state(entity)
+
+                self.states[entity] = state
+                self.updated_at[entity] = app.get_timestamp()
+
+            self.consumers.setdefault(entity, {}).setdefault(callback, set()).add(app.name)
+
+            return self.states[entity]
+
+    async def unregister(self, app):
+        """Drops every subscription of app, and the entities nobody else subscribes to"""
+
+        async with self.lock:
+            if self.apps.pop(app.name, None) is None:
+                return
+
+            for entity in list(self.consumers):
+                callbacks = self.consumers[entity]
+
+                for callback in list(callbacks):
+                    callbacks[callback].discard(app.name)
+
+                    if not callbacks[callback]:
+                        del callbacks[callback]
+
+                if not callbacks:
+                    del self.consumers[entity]
+                    await self.owner.cancel_listen_state(self.handles.pop(entity))
+
+                    self.states.pop(entity, None)
+                    self.updated_at.pop(entity, None)
+
+            if self.owner is not app:
+                return
+
+            self.owner = next(iter(self.apps.values()), None)
+
+            if self.owner is None:
+                release(self)
+                return
+
+            # Subscribed again before the old subscription goes, a change seen by both is skipped
+            for entity, handle in list(self.handles.items()):
+                self.handles[entity] = await self.owner.listen_state(self.on_state_change, entity)
+                await app.cancel_listen_state(handle)
+
+    async def on_state_change(self, entity, attribute, old, new, kwargs):
+
+        if entity not in self.consumers or self.states.get(entity) == new:
+            return
+
+        self.states[entity] = new
+        self.updated_at[entity] = self.owner.get_timestamp()
+
+        for callback, holders in list(self.consumers[entity].items()):
+            try:
+                result = callback(entity, old, new)
+
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                app = self.apps.get(next(iter(holders), None), self.owner)
+                app.log(f"Error in the {entity} callback {callback.__qualname__}:\n" + traceback.format_exc())
+
+shared = ProcessShared(EntityHub)
+
+def get_hub() -> EntityHub:
+    return shared.get()
+
+def release(released: EntityHub):
+    shared.release(released)
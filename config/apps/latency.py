@@ -0,0 +1,60 @@
+import math
+
+class LatencyHistogram:
+    """
+    Fixed-memory histogram of durations in seconds.
+
+    Buckets are log-scaled, each one 2^(1/4) (about 19%) wider than the previous,
+    from 0.1 ms up to about 30 s. Quantiles are reported as the upper edge of
+    their bucket.
+    """
+
+    min_value = 0.0001
+    growth = 2 ** 0.25
+    bucket_count = 74
+
+    def __init__(self):
+        self.counts = [0] * LatencyHistogram.bucket_count
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+
+        if seconds <= LatencyHistogram.min_value:
+            index = 0
+        else:
+            index = min(
+                int(math.log(seconds / LatencyHistogram.min_value, LatencyHistogram.growth)) + 1,
+                LatencyHistogram.bucket_count - 1
+            )
+
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(LatencyHistogram.min_value * LatencyHistogram.growth ** index, self.max)
+
+        return self.max
+
+    def summary(self):
+        """Durations in milliseconds"""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * 1000, 2),
+            "p95_ms": round(self.quantile(0.95) * 1000, 2),
+            "p99_ms": round(self.quantile(0.99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
@@ -0,0 +1,136 @@
+import asyncio
+import traceback
+from collections import deque
+
+class NotificationDispatcher:
+    """
+    Sends notifications from a background task, so the control loop never waits on the notify service.
+
+    The sender runs as the notifications task of the app's supervisor. enqueue() returns at
+    once. A message identical to one enqueued within dedupe_window is dropped, a title is sent
+    at most once per title_interval and messages with the same title that queue up meanwhile
+    go out as one digest. When the queue is full the oldest message is dropped.
+    enqueue() has to be called from the event loop, so from async code or async callbacks.
+    """
+
+    def __init__(self, app, service, max_queue=20, dedupe_window=600, title_interval=60):
+        self.app = app
+        self.service = service
+        self.max_queue = max_queue
+        self.dedupe_window = dedupe_window
+        self.title_interval = title_interval
+
+        self.queue = deque()            # (title, msg)
+        self.recent = {}                # (title, msg) -> timestamp last enqueued
+        self.last_sent = {}             # title -> timestamp last sent
+        self.wakeup = asyncio.Event()
+
+        self.sent = 0
+        self.merged = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def enqueue(self, title, msg) -> bool:
+        """Returns False if the message was a duplicate"""
+
+        now = self.app.get_timestamp()
+        self.prune_recent(now)
+
+        key = (title, msg)
+        if now - self.recent.get(key, float("-inf")) < self.dedupe_window:
+            self.deduped += 1
+            return False
+
+        self.recent[key] = now
+
+        if len(self.queue) >= self.max_queue:
+            self.queue.popleft()
+            self.dropped += 1
+
+        self.queue.append(key)
+        self.wakeup.set()
+
+        if not self.app.tasks.is_running("notifications"):
+            self.app.tasks.start("notifications", self.run)
+
+        return True
+
+    def prune_recent(self, now):
+        # Bounded by what can be enqueued within one window, only pruned once it grows
+        if len(self.recent) > self.max_queue * 4:
+            self.recent = {key: ts for key, ts in self.recent.items() if now - ts < self.dedupe_window}
+
+    async def run(self):
+
+        while True:
+            self.wakeup.clear()
+
+            if not self.queue:
+                await self.wakeup.wait()
+                continue
+
+            now = self.app.get_timestamp()
+            title, wait = self.next_title(now)
+
+            if title is None:
+                # Every queued title is rate limited, an enqueue can bring a sendable one
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.send(title, self.take(title))
+
+    def next_title(self, now):
+        """Returns the first queued title that may be sent, or None and the seconds until one may"""
+
+        min_wait = None
+
+        for title, _ in self.queue:
+            wait = self.last_sent.get(title, float("-inf")) + self.title_interval - now
+
+            if wait <= 0:
+                return title, 0
+
+            min_wait = wait if min_wait is None else min(min_wait, wait)
+
+        return None, min_wait
+
+    def take(self, title):
+        messages = [msg for queued_title, msg in self.queue if queued_title == title]
+        self.queue = deque(item for item in self.queue if item[0] != title)
+        return messages
+
+    async def send(self, title, messages):
+
+        if len(messages) > 1:
+            self.merged += len(messages) - 1
+            message = f"{len(messages)} notifications:\n" + "\n".join(messages)
+        else:
+            message = messages[0]
+
+        self.last_sent[title] = self.app.get_timestamp()
+
+        try:
+            await self.app.call_service(
+                self.service,
+                title=title,
+                message=message,
+                data= { "ttl": 0, "priority": "high" }
+            )
+            self.sent += 1
+        except Exception:
+            self.failed += 1
+            self.app.log("Error sending notification:\n" + traceback.format_exc())
+
+    def stats(self):
+        return {
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "merged": self.merged,
+            "deduped": self.deduped,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+from process_shared import ProcessShared
+
+class PatrolCoordinator:
+    """
+    Shared by every CameraPatrol app, so the cost of the patrols stays flat as cameras are added.
+
+    One loop timer, armed for the earliest of a heap of deadlines, runs the dwell timers of
+    all cameras. The sleep state and the bedroom door are followed through the entity hub
+    with one callback for all cameras, which fans the door changes out. Preset moves of
+    cameras on the same PTZ controller are spaced move_interval apart so they never overlap.
+    """
+
+    sleep_state_ent = "input_boolean.is_sleep_state"
+    door_sensor_ent = "binary_sensor.bedroom_door_sensor_contact"
+
+    move_interval = 2 # seconds between preset moves on one PTZ controller
+
+    def __init__(self):
+        self.cameras = {}           # app name -> CameraPatrol
+        self.hub = None
+
+        self.deadlines = []         # heap of (loop time, app name), stale entries are skipped
+        self.dwell_deadlines = {}   # app name -> current deadline
+        self.timer: asyncio.TimerHandle = None
+
+        self.next_move = {}         # controller -> loop time its next move may start
+
+    @property
+    def sleep_state(self):
+        return self.hub.states.get(PatrolCoordinator.sleep_state_ent)
+
+    @property
+    def door_sensor_state(self):
+        return self.hub.states.get(PatrolCoordinator.door_sensor_ent)
+
+    async def register(self, camera):
+        self.cameras[camera.name] = camera
+        self.hub = camera.hub
+
+        # The camera's hold on the subscriptions goes with its release_entities()
+        for entity in (PatrolCoordinator.sleep_state_ent, PatrolCoordinator.door_sensor_ent):
+            await self.hub.subscribe(camera, entity, self.on_entity_change)
+
+    def unregister(self, camera):
+        self.cameras.pop(camera.name, None)
+        self.cancel_dwell(camera)
+
+        if not self.cameras:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+            release(self)
+
+    def on_entity_change(self, entity, old, new):
+
+        if entity == PatrolCoordinator.door_sensor_ent:
+            for camera in list(self.cameras.values()):
+                camera.on_door_sensor_change(old, new)
+
+    def schedule_dwell(self, camera, delay):
+        """Calls the camera's on_dwell_done after delay seconds, replacing its pending deadline"""
+
+        deadline = asyncio.get_running_loop().time() + delay
+
+        self.dwell_deadlines[camera.name] = deadline
+        heapq.heappush(self.deadlines, (deadline, camera.name))
+
+        # Replaced deadlines stay in the heap until they expire, motion can pile them up
+        if len(self.deadlines) > 4 * len(self.cameras) + 16:
+            self.deadlines = [(deadline, name) for name, deadline in self.dwell_deadlines.items()]
+            heapq.heapify(self.deadlines)
+
+        if self.timer is None or deadline < self.timer.when():
+            self.arm_timer()
+
+    def cancel_dwell(self, camera):
+        self.dwell_deadlines.pop(camera.name, None)
+
+    def arm_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if self.deadlines:
+            self.timer = asyncio.get_running_loop().call_at(self.deadlines[0][0], self.on_timer)
+
+    def on_timer(self):
+        self.timer = None
+        now = asyncio.get_running_loop().time()
+
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, name = heapq.heappop(self.deadlines)
+
+            if self.dwell_deadlines.get(name) != deadline:
+                continue
+
+            del self.dwell_deadlines[name]
+            self.cameras[name].on_dwell_done()
+
+        self.arm_timer()
+
+    async def move_to_preset(self, camera, preset):
+        """Waits for the camera's PTZ controller to be free before selecting the preset"""
+
+        controller = camera.ptz_controller
+        now = asyncio.get_running_loop().time()
+
+        # Reserving the slot before waiting keeps concurrent moves in order without a lock
+        slot = max(now, self.next_move.get(controller, now))
+        self.next_move[controller] = slot + PatrolCoordinator.move_interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+        await camera.call_service("select/select_option", entity_id=camera.move_to_preset_ent, option=preset)
+
+shared = ProcessShared(PatrolCoordinator)
+
+def get_coordinator() -> PatrolCoordinator:
+    return shared.get()
+
+def release(released: PatrolCoordinator):
+    shared.release(released)
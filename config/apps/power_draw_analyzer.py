@@ -0,0 +1,215 @@
+from array import array
+
+class PowerDrawAnalyzer:
+    """
+    Rolling statistics over the power draw samples of the last window seconds.
+
+    Samples live in fixed-size array ring buffers and the sums behind every statistic
+    are updated when a sample enters or leaves the window, so adding a sample is O(1). They
+    are rebuilt from the samples once per lap of the buffer, which keeps them small and exact.
+    Each sample holds until the next one, which is how the sensor reports changes.
+
+    Timestamps are wall clock seconds, so low_draw_since survives a restart.
+    A low draw is a draw above running_threshold (compressor on) but below
+    low_draw_threshold, which is what a radiator that has frozen over looks like.
+    """
+
+    def __init__(self, window, running_threshold, low_draw_threshold, capacity=1024):
+        self.window = window
+        self.capacity = capacity
+        self.running_threshold = running_threshold
+        self.low_draw_threshold = low_draw_threshold
+
+        self.times = array("d", bytes(8 * capacity))
+        self.watts = array("d", bytes(8 * capacity))
+        self.head = 0   # index of the oldest sample
+        self.size = 0
+
+        # Between consecutive samples in the window
+        self.duration = 0.0
+        self.energy = 0.0       # watt seconds
+        self.below = 0.0        # seconds below low_draw_threshold
+
+        # Least squares sums over the samples, times relative to time_origin
+        self.time_origin = 0.0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+
+        self.low_draw_since = None # start of the current low draw, None when not in low draw
+
+    def __len__(self):
+        return self.size
+
+    def index(self, i):
+        return (self.head + i) % self.capacity
+
+    def is_low_draw(self, watts):
+        return self.running_threshold < watts < self.low_draw_threshold
+
+    def add_sample(self, timestamp, watts):
+
+        if self.size:
+            last = self.index(self.size - 1)
+            dt = timestamp - self.times[last]
+
+            # Out of order, the window only moves forward
+            if dt < 0:
+                return
+
+            self.add_segment(dt, self.watts[last], 1)
+
+            if self.size == self.capacity:
+                self.evict()
+        else:
+            self.time_origin = timestamp
+
+        i = self.index(self.size)
+        self.times[i] = timestamp
+        self.watts[i] = watts
+        self.size += 1
+        self.add_point(timestamp, watts, 1)
+
+        if not self.is_low_draw(watts):
+            self.low_draw_since = None
+        elif self.low_draw_since is None:
+            self.low_draw_since = timestamp
+
+        # Keeps the last sample before the window start, it holds the draw at the start
+        while self.size > 1 and self.times[self.index(1)] <= timestamp - self.window:
+            self.evict()
+
+    def evict(self):
+        oldest = self.head
+
+        if self.size > 1:
+            self.add_segment(self.times[self.index(1)] - self.times[oldest], self.watts[oldest], -1)
+
+        self.add_point(self.times[oldest], self.watts[oldest], -1)
+
+        self.head = self.index(1)
+        self.size -= 1
+
+        # Once per lap of the ring buffer, so the cost stays O(1) per sample
+        if self.head == 0:
+            self.recompute_sums()
+
+    def recompute_sums(self):
+        """
+        Sums from the samples in the window, relative to the oldest one. Adding and removing
+        samples leaves rounding errors behind, and times relative to a fixed origin would make
+        sum_xx grow without bound, so they are rebuilt instead of only ever updated.
+        """
+        self.duration = self.energy = self.below = 0.0
+        self.sum_x = self.sum_y = self.sum_xx = self.sum_xy = 0.0
+
+        if not self.size:
+            return
+
+        self.time_origin = self.times[self.head]
+
+        for i in range(self.size):
+            self.add_point(self.times[self.index(i)], self.watts[self.index(i)], 1)
+
+            if i + 1 < self.size:
+                self.add_segment(self.times[self.index(i + 1)] - self.times[self.index(i)], self.watts[self.index(i)], 1)
+
+    def add_segment(self, dt, watts, sign):
+        self.duration += sign * dt
+        self.energy += sign * dt * watts
+
+        if watts < self.low_draw_threshold:
+            self.below += sign * dt
+
+    def add_point(self, timestamp, watts, sign):
+        x = timestamp - self.time_origin
+
+        self.sum_x += sign * x
+        self.sum_y += sign * watts
+        self.sum_xx += sign * x * x
+        self.sum_xy += sign * x * watts
+
+    def set_thresholds(self, running_threshold, low_draw_threshold):
+        """Recounts the time below threshold and the current low draw, O(window)"""
+
+        self.running_threshold = running_threshold
+        self.low_draw_threshold = low_draw_threshold
+
+        self.below = 0.0
+        for i in range(self.size - 1):
+            if self.watts[self.index(i)] < low_draw_threshold:
+                self.below += self.times[self.index(i + 1)] - self.times[self.index(i)]
+
+        # Walks back from the newest sample to where the low draw started
+        low_draw_since = None
+        for i in range(self.size - 1, -1, -1):
+            if not self.is_low_draw(self.watts[self.index(i)]):
+                break
+            low_draw_since = self.times[self.index(i)]
+
+        self.low_draw_since = low_draw_since
+
+    def latest(self):
+        return self.watts[self.index(self.size - 1)] if self.size else None
+
+    def tail(self, now):
+        """Seconds the latest sample has held up to now, it is not part of the sums yet"""
+
+        if now is None or not self.size:
+            return 0.0
+
+        return max(0.0, now - self.times[self.index(self.size - 1)])
+
+    def mean(self, now=None):
+        """Time-weighted mean draw in watts"""
+
+        tail = self.tail(now)
+        duration = self.duration + tail
+
+        if duration <= 0:
+            return self.latest()
+
+        return (self.energy + tail * self.latest()) / duration
+
+    def time_below_threshold(self, now=None):
+        latest = self.latest()
+
+        if latest is not None and latest < self.low_draw_threshold:
+            return self.below + self.tail(now)
+
+        return self.below
+
+    def slope(self):
+        """Least squares trend of the draw in watts per second"""
+
+        denominator = self.size * self.sum_xx - self.sum_x * self.sum_x
+
+        if self.size < 2 or denominator <= 0:
+            return 0.0
+
+        return (self.size * self.sum_xy - self.sum_x * self.sum_y) / denominator
+
+    def low_draw_duration(self, now):
+        if self.low_draw_since is None:
+            return 0.0
+
+        return max(0.0, now - self.low_draw_since)
+
+    def is_freeze_onset(self, now, max_low_draw_duration):
+        return self.low_draw_since is not None and self.low_draw_duration(now) >= max_low_draw_duration
+
+    def restart_low_draw(self, now):
+        """Starts counting the low draw again from now, if the latest sample still is one"""
+
+        latest = self.latest()
+        self.low_draw_since = now if latest is not None and self.is_low_draw(latest) else None
+
+    def stats(self, now):
+        return {
+            "samples": self.size,
+            "mean_w": self.mean(now),
+            "below_threshold_s": self.time_below_threshold(now),
+            "slope_w_per_min": self.slope() * 60,
+            "low_draw_s": self.low_draw_duration(now),
+        }
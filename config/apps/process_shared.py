@@ -0,0 +1,24 @@
+class ProcessShared:
+    """
+    One object shared by every app of the AppDaemon process.
+
+    AppDaemon runs all apps in one interpreter, so a module level ProcessShared hands the
+    same object to each of them. get() creates it on first use, release() forgets it once its
+    last app is gone so the next app, after a reload for example, starts afresh.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.instance = None
+
+    def get(self):
+        if self.instance is None:
+            self.instance = self.factory()
+
+        return self.instance
+
+    def release(self, released):
+        """Only forgets released if it still is the shared object"""
+
+        if self.instance is released:
+            self.instance = None
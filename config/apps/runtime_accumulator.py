@@ -0,0 +1,63 @@
+from bisect import bisect_right
+
+class RuntimeAccumulator:
+    """
+    Tracks how long something has been on from its on/off transitions.
+
+    Timestamps are monotonic seconds. The cumulative on-time is stored at every
+    transition, so the runtime over any window is two binary searches instead of
+    a walk through the history. Transitions older than retention are dropped.
+    """
+
+    def __init__(self, retention=24 * 3600):
+        self.retention = retention
+
+        self.times = []     # timestamp of each transition
+        self.totals = []    # cumulative on-time at that transition
+        self.states = []    # on/off after that transition
+
+    def is_active(self):
+        return bool(self.states) and self.states[-1]
+
+    def set_active(self, active, now):
+
+        if self.states and self.states[-1] == active:
+            return
+
+        self.totals.append(self.total_at(now))
+        self.times.append(now)
+        self.states.append(active)
+
+        self.prune(now)
+
+    def total_at(self, timestamp):
+        """Cumulative on-time up to timestamp"""
+
+        i = bisect_right(self.times, timestamp) - 1
+        if i < 0:
+            return 0.0
+
+        total = self.totals[i]
+        if self.states[i]:
+            total += timestamp - self.times[i]
+
+        return total
+
+    def runtime_between(self, start, end):
+        return max(0.0, self.total_at(end) - self.total_at(start))
+
+    def restore(self, seconds, active, now):
+        """Replaces the history with seconds of runtime ending at now, used when resuming from a snapshot"""
+
+        self.times = [now - seconds, now]
+        self.totals = [0.0, seconds]
+        self.states = [True, active]
+
+    def prune(self, now):
+        # Keeps the last transition before the cutoff, it holds the state at the cutoff
+        cutoff = bisect_right(self.times, now - self.retention) - 1
+
+        if cutoff > 0:
+            del self.times[:cutoff]
+            del self.totals[:cutoff]
+            del self.states[:cutoff]
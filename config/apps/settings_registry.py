@@ -0,0 +1,91 @@
+import inspect
+from dataclasses import dataclass
+from datetime import datetime, time
+from typing import Any, Callable, Optional
+
+def parse_bool(state) -> bool:
+    if state == "on":
+        return True
+    if state == "off":
+        return False
+
+    raise ValueError(f"expected on or off, got {state!r}")
+
+def parse_time(state) -> time:
+    # input_datetime with only the time has the state hh:mm:ss
+    return datetime.strptime(str(state), "%H:%M:%S").time()
+
+@dataclass
+class Setting:
+    """
+    A Home Assistant helper entity kept as a typed attribute on the app.
+    on_change is called with the old and new value after a valid change, it may be async.
+    """
+    entity: str
+    attr: str
+    parser: Callable[[Any], Any] = float
+    on_change: Optional[Callable[[Any, Any], Any]] = None
+
+class SettingsRegistry:
+    """
+    Loads settings, validates them and follows their changes.
+
+    Values are parsed once, when they are loaded or changed, so the app reads them as plain
+    attributes. An invalid value fails the load, an invalid change is logged and the
+    previous value kept.
+
+    Startup costs one round trip: every register() call while the app initializes reads
+    from one snapshot of all states, taken once, unless another app already follows the
+    entity through the hub. release_snapshot() ends the initialization. Changes come in
+    through the app's entity hub, which the apps share.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.settings: dict[str, Setting] = {}
+        self.snapshot = None
+
+    async def register(self, settings: list[Setting]):
+
+        if self.snapshot is None:
+            self.snapshot = await self.app.get_state()
+
+        for setting in settings:
+            self.settings[setting.entity] = setting
+            state = await self.app.hub.subscribe(self.app, setting.entity, self.on_setting_change, self.snapshot)
+
+            try:
+                value = setting.parser(state)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Setting {setting.entity} has an invalid value {state!r}: {e}") from e
+
+            setattr(self.app, setting.attr, value)
+            self.app.dev_log(setting.attr, value)
+
+    def release_snapshot(self):
+        self.snapshot = None
+
+    async def on_setting_change(self, entity, old, new):
+        setting = self.settings[entity]
+
+        try:
+            value = setting.parser(new)
+        except (TypeError, ValueError) as e:
+            self.app.log(f"Ignoring invalid value {new!r} of {entity}, keeping {getattr(self.app, setting.attr)!r}: {e}")
+            return
+
+        old_value = getattr(self.app, setting.attr)
+        if value == old_value:
+            return
+
+        setattr(self.app, setting.attr, value)
+        self.app.dev_log("Setting '{attr}' updated to", value, attr=setting.attr)
+
+        if setting.on_change is not None:
+            result = setting.on_change(old_value, value)
+
+            if inspect.isawaitable(result):
+                await result
+
+    def values(self):
+        return {setting.attr: getattr(self.app, setting.attr) for setting in self.settings.values()}
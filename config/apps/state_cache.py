@@ -0,0 +1,55 @@
+class StateCache:
+    """
+    In-memory mirror of Home Assistant entity states.
+
+    Values are pushed in by state-change callbacks, so reads never
+    touch Home Assistant. Counts hits, misses and stale reads.
+
+    With a hub the values are the hub's, shared with the other apps,
+    and only the entities tracked by this app count as cached.
+    """
+
+    def __init__(self, hub=None):
+        self.states = hub.states if hub is not None else {}
+        self.updated_at = hub.updated_at if hub is not None else {}
+        self.max_ages = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_reads = 0
+
+    def __contains__(self, entity):
+        return entity in self.max_ages and entity in self.states
+
+    def track(self, entity, max_age=None):
+        """max_age: seconds without an update before a read counts as stale (None = never)"""
+        self.max_ages[entity] = max_age
+
+    def is_tracked(self, entity):
+        return entity in self.max_ages
+
+    def get(self, entity, timestamp, default=None):
+
+        if entity not in self:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+
+        max_age = self.max_ages.get(entity)
+        if max_age is not None and timestamp - self.updated_at[entity] > max_age:
+            self.stale_reads += 1
+
+        return self.states[entity]
+
+    def peek(self, entity, default=None):
+        """Like get, but not counted as a read"""
+        return self.states.get(entity, default) if entity in self.max_ages else default
+
+    def stats(self):
+        return {
+            "entities": len(self.max_ages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_reads": self.stale_reads,
+        }
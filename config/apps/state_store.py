@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+
+class StateStore:
+    """
+    Versioned JSON snapshot of an app's mutable state on disk.
+
+    Writes go to a temp file that is renamed over the old snapshot, so a crash
+    never leaves a half written file. At most one write per min_interval seconds,
+    skipped saves are kept as pending and written by the next save or flush.
+
+    The replay tools set memory to a dict, their snapshots then only live as long as the
+    process, kept there as JSON by path instead of on disk.
+    """
+
+    memory = None
+
+    def __init__(self, path, version, min_interval):
+        self.path = path
+        self.version = version
+        self.min_interval = min_interval
+
+        self.last_write_at = None
+        self.pending = None
+
+    def load(self):
+        """Returns the saved state, or None if there is none or it is from another version"""
+
+        try:
+            if StateStore.memory is not None:
+                snapshot = json.loads(StateStore.memory[self.path])
+            else:
+                with open(self.path, "r") as f:
+                    snapshot = json.load(f)
+        except (FileNotFoundError, KeyError):
+            return None
+
+        if snapshot.get("version") != self.version:
+            return None
+
+        return snapshot.get("state")
+
+    def save(self, state, now, force=False) -> bool:
+        """Returns True if the state was written"""
+
+        if not force and self.last_write_at is not None and now - self.last_write_at < self.min_interval:
+            self.pending = state
+            return False
+
+        self.write(state)
+        self.last_write_at = now
+        self.pending = None
+        return True
+
+    def flush(self, now):
+        if self.pending is not None:
+            self.save(self.pending, now, force=True)
+
+    def write(self, state):
+
+        if StateStore.memory is not None:
+            StateStore.memory[self.path] = json.dumps({"version": self.version, "state": state}, separators=(",", ":"))
+            return
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": self.version, "state": state}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -1,23 +1,211 @@
+import asyncio
+import json
+import time
+from enum import IntEnum
 from datetime import datetime
 from datetime import timedelta
 import appdaemon.plugins.hass.hassapi as hass
+from state_cache import StateCache
+from entity_hub import EntityHub, get_hub
+from latency import LatencyHistogram
+from notification_dispatcher import NotificationDispatcher
+from task_supervisor import TaskSupervisor
+
+class LogLevel(IntEnum):
+    OFF = 0
+    INFO = 1
+    DEBUG = 2   # dev logs
 
 class Support(hass.Hass):
 
+    latency_publish_interval = 300 # seconds between latency, notification and task sensor updates
+    mobile_notify_service = "notify/mobile_app_robins_oneplus_13"
+    dev_log_prefix = "->"
+
+    def init_support(self, dev_logs=False):
+        """
+        dev_logs sets the default log level, the log_level arg (off, info, debug) overrides it.
+        log_level_ent can point at an input_select with the same options to change it at runtime.
+        """
+        self.log_json = bool(self.args.get("log_json", False))
+        self.set_log_level(self.args.get("log_level", "debug" if dev_logs else "info"))
+
+        log_level_ent = self.args.get("log_level_ent")
+        if log_level_ent:
+            self.listen_state(self.on_log_level_ent_change, log_level_ent, immediate=True)
+
+        # Subscriptions and cached states are shared with the other apps through the hub
+        self.hub: EntityHub = get_hub()
+        self.state_cache = StateCache(self.hub)
+
+        # Round trip times of get_state per entity domain and call_service per service
+        self.latency_histograms: dict[str, LatencyHistogram] = {}
+        self.run_every(self.publish_latency_histograms, "now", Support.latency_publish_interval)
+
+        # Every background coroutine of the app runs as a named task of the supervisor
+        self.tasks = TaskSupervisor(self)
+        self.notifications = NotificationDispatcher(self, Support.mobile_notify_service)
+
+    async def get_state(self, entity_id=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().get_state(entity_id, *args, **kwargs)
+        finally:
+            domain = entity_id.split(".")[0] if entity_id else "all"
+            self.record_latency(f"get_state_{domain}", time.perf_counter() - start)
+
+    async def call_service(self, service, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().call_service(service, **kwargs)
+        finally:
+            self.record_latency(f"call_service_{service.replace('/', '_')}", time.perf_counter() - start)
+
+    def record_latency(self, key, seconds):
+        histogram = self.latency_histograms.get(key)
+
+        if histogram is None:
+            histogram = self.latency_histograms[key] = LatencyHistogram()
+
+        histogram.record(seconds)
+
+    async def publish_latency_histograms(self, kwargs):
+        """
+        Publishes the latencies since the last publish as sensor.<app>_latency_<key>,
+        state is p95 in ms with the other quantiles as attributes.
+        Also publishes the notification queue depth and counters as sensor.<app>_notification_queue,
+        and the number of live background tasks as sensor.<app>_tasks with the tasks as attribute.
+        """
+        histograms = self.latency_histograms
+        self.latency_histograms = {}
+
+        for key, histogram in histograms.items():
+            summary = histogram.summary()
 
-    async def send_mobile_notification(self, title, msg):
-        await self.call_service(
-            "notify/mobile_app_robins_oneplus_13",
-            title=title,
-            message=msg,
-            data= { "ttl": 0, "priority": "high" }
+            await self.set_state(
+                f"sensor.{self.name}_latency_{key}",
+                state=summary["p95_ms"],
+                attributes=dict(summary, unit_of_measurement="ms", friendly_name=f"{self.name} {key} latency")
+            )
+
+        stats = self.notifications.stats()
+        await self.set_state(
+            f"sensor.{self.name}_notification_queue",
+            state=stats["queued"],
+            attributes=dict(stats, friendly_name=f"{self.name} notification queue")
+        )
+
+        tasks = self.tasks.live_tasks()
+        await self.set_state(
+            f"sensor.{self.name}_tasks",
+            state=len(tasks),
+            attributes={"tasks": tasks, "friendly_name": f"{self.name} tasks"}
         )
+
+    async def cache_entities(self, entities, max_age=None, snapshot=None):
+        """
+        Subscribes each entity through the hub and keeps its state in the state cache.
+        Entities already cached are skipped. Entities new to the hub get their initial state
+        from snapshot, all states as returned by get_state(), or else from one get_state()
+        of all states.
+        """
+        entities = [ent for ent in entities if not self.state_cache.is_tracked(ent)]
+
+        if snapshot is None and any(ent not in self.hub.handles for ent in entities):
+            snapshot = await self.get_state()
+
+        for ent in entities:
+            self.state_cache.track(ent, max_age)
+            await self.hub.subscribe(self, ent, self.on_cached_entity_change, snapshot)
+
+    def on_cached_entity_change(self, entity, old, new):
+        # The hub has already stored the new state
+        self.on_state_cache_update(entity, old, new)
+
+    def on_state_cache_update(self, entity, old, new):
+        """Called after a cached entity changed, overridden by apps that react to it"""
+        return
+
+    async def release_entities(self):
+        """Drops the app's hub subscriptions, called from terminate"""
+        await self.hub.unregister(self)
+
+    def get_cached_state(self, entity, default=None):
+        return self.state_cache.get(entity, self.get_timestamp(), default)
+
+    async def read_state(self, entity):
+        """
+        Returns the cached state, only falls back to get_state for entities that are not cached.
+        """
+        if entity in self.state_cache:
+            return self.get_cached_state(entity)
+
+        # Counts the miss
+        self.get_cached_state(entity)
+        return await self.get_state(entity)
+
+    async def get_states_snapshot(self, entities):
+        """
+        Returns a dict with the state of every entity, read at one point in time.
+        Cached entities come from memory, the rest are fetched concurrently.
+        """
+        snapshot = {ent: self.get_cached_state(ent) for ent in entities if ent in self.state_cache}
+        missing = [ent for ent in entities if ent not in snapshot]
+
+        if missing:
+            # Counts the misses
+            for ent in missing:
+                self.get_cached_state(ent)
+
+            states = await asyncio.gather(*(self.get_state(ent) for ent in missing))
+            snapshot.update(zip(missing, states))
+
+        return snapshot
+
+    async def wait_for_state(self, entity, value=None, predicate=None, attribute=None, timeout=10):
+        """
+        Waits until the state of entity, or its attribute, equals value or satisfies predicate.
+        Returns True as soon as it does, at once if it already does, and False after timeout seconds.
+
+            await self.wait_for_state("select.camera_1_move_to_preset", "Privacy", timeout=15)
+            await self.wait_for_state("sensor.camera_1_tilt", predicate=lambda tilt: float(tilt) < 5)
+        """
+        if predicate is None:
+            predicate = lambda state: state == value
+
+        matched = asyncio.get_running_loop().create_future()
+
+        async def on_change(entity, attribute, old, new, kwargs):
+            if not matched.done() and predicate(new):
+                matched.set_result(True)
+
+        # Subscribed before reading the current state, so a change in between is not missed
+        handle = await self.listen_state(on_change, entity, attribute=attribute)
+
+        try:
+            if predicate(await self.get_state(entity, attribute=attribute)):
+                return True
+
+            try:
+                return await asyncio.wait_for(matched, timeout)
+            except asyncio.TimeoutError:
+                return False
+        finally:
+            await self.cancel_listen_state(handle)
+
+
+    def send_mobile_notification(self, title, msg):
+        """Queues the notification and returns, it is sent by the notification dispatcher"""
+        self.notifications.enqueue(title, msg)
 	
     def get_timestamp_in_seconds(self):
         return int(datetime.now().timestamp())
     
     def get_timestamp(self):
         return datetime.now().timestamp()
+
+    def get_monotonic(self):
+        return time.monotonic()
     
     
     def get_datetime_in_local_time(self):
@@ -27,16 +215,53 @@ class Support(hass.Hass):
     
         return datetime.now().astimezone()
 
-    def dev_log(self, msg, args=None):
-        if self.dev_logs:
+    def set_log_level(self, level):
+        self.log_level = LogLevel[str(level).upper()]
+
+    def on_log_level_ent_change(self, entity, attribute, old, new, kwargs):
+        try:
+            self.set_log_level(new)
+        except KeyError:
+            self.log(f"Unknown log level '{new}' in {entity}, keeping {self.log_level.name.lower()}")
+
+    def dev_log(self, msg, args=None, **fields):
+        """
+        Debug log. Nothing is formatted unless the debug level is on, so pass values as
+        fields of a str.format template, and args that are costly to build as a callable.
+
+            self.dev_log("Temp: {temp:.2f}", temp=temp)
+            self.dev_log("State cache", self.state_cache.stats)
+        """
+        if self.log_level >= LogLevel.DEBUG:
+            self.write_log(msg, args, fields)
+
+    def info_log(self, msg, args=None, **fields):
+        if self.log_level >= LogLevel.INFO:
+            self.write_log(msg, args, fields)
 
-            if args is None:
-                self.log(f"-> {msg}")
-            else:
-                if isinstance(args, float):
-                    self.log(f"-> {msg}: {round(args, 2)}")
-                else:
-                    self.log(f"-> {msg}: {args}")
+    def write_log(self, msg, args, fields):
+
+        if callable(args):
+            args = args()
+
+        if self.log_json:
+            record = {"msg": msg}
+            if args is not None:
+                record["value"] = args
+            record.update(fields)
+
+            self.log(json.dumps(record, default=str))
+            return
+
+        if fields:
+            msg = msg.format(**fields)
+
+        if args is None:
+            self.log(f"{self.dev_log_prefix} {msg}")
+        elif isinstance(args, float):
+            self.log(f"{self.dev_log_prefix} {msg}: {round(args, 2)}")
+        else:
+            self.log(f"{self.dev_log_prefix} {msg}: {args}")
 
 
     def is_weekend(self, dt=None):
@@ -45,15 +270,9 @@ class Support(hass.Hass):
         
         return dt.weekday() >= 5
 
-    def get_time_from_ha_time_input(self, time_input):
-        return datetime.strptime(str(time_input), "%H:%M:%S").time()
-    
-    def get_datetime_from_ha_time_input(self, time_input):
-        """
-        Parses a time string and returns a timezone-aware datetime for today.
-        """
-        now_dt = datetime.now().astimezone()
-        time_obj = self.get_time_from_ha_time_input(time_input)
+    def get_datetime_today_at(self, time_obj):
+        """Timezone-aware datetime for today at time_obj"""
+        now_dt = self.get_datetime_in_local_time()
 
         return now_dt.replace(
             hour=time_obj.hour,
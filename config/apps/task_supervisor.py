@@ -0,0 +1,120 @@
+import asyncio
+import traceback
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+@dataclass
+class SupervisedTask:
+    name: str
+    factory: Callable[[], Awaitable]
+    restart: bool
+    min_backoff: float
+    on_error: Optional[Callable[[Exception], None]]
+
+    task: asyncio.Task = None
+    started_at: float = 0.0         # loop time the current attempt started
+    restarts: int = 0
+    last_error: Optional[str] = None
+    backoff: float = field(init=False)
+
+    def __post_init__(self):
+        self.backoff = self.min_backoff
+
+class TaskSupervisor:
+    """
+    The named background tasks of an app, at most one per name.
+
+    start() cancels the running task of the same name before starting the new one, so a
+    loop can never run twice. A task that raises is restarted from its factory after a
+    backoff that doubles from min_backoff up to max_backoff, and starts over from min_backoff
+    once an attempt ran for reset_after seconds. A task that returns or is cancelled is
+    forgotten, so memory is bounded by the number of names.
+
+    The tasks are created on the event loop directly, AppDaemon's create_task hands back a
+    wrapper task there that can not cancel the coroutine. Must be called from the event loop.
+    """
+
+    max_backoff = 300
+    reset_after = 600
+    max_error_length = 200
+
+    def __init__(self, app):
+        self.app = app
+        self.tasks: dict[str, SupervisedTask] = {}
+
+    def start(self, name, factory, restart=True, min_backoff=1, on_error=None) -> asyncio.Task:
+        """
+        factory is called without arguments for every attempt and returns the coroutine.
+        on_error is called with the exception of a failed attempt, before the backoff.
+        """
+        self.cancel(name)
+
+        entry = self.tasks[name] = SupervisedTask(name, factory, restart, min_backoff, on_error)
+        entry.task = asyncio.get_running_loop().create_task(self.supervise(entry), name=f"{self.app.name}.{name}")
+
+        return entry.task
+
+    def cancel(self, name):
+        entry = self.tasks.pop(name, None)
+
+        if entry is not None and entry.task is not asyncio.current_task():
+            entry.task.cancel()
+
+    def cancel_all(self):
+        for name in list(self.tasks):
+            self.cancel(name)
+
+    def is_running(self, name):
+        return name in self.tasks
+
+    async def supervise(self, entry: SupervisedTask):
+        loop = asyncio.get_running_loop()
+
+        try:
+            while True:
+                entry.started_at = loop.time()
+
+                try:
+                    await entry.factory()
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    entry.last_error = f"{type(e).__name__}: {e}"[:TaskSupervisor.max_error_length]
+                    entry.restarts += 1
+
+                    if loop.time() - entry.started_at >= TaskSupervisor.reset_after:
+                        entry.backoff = entry.min_backoff
+
+                    if entry.restart:
+                        self.app.log(f"Task {entry.name} failed, restarting in {entry.backoff} s:\n" + traceback.format_exc())
+                    else:
+                        self.app.log(f"Task {entry.name} failed:\n" + traceback.format_exc())
+
+                    if entry.on_error is not None:
+                        try:
+                            entry.on_error(e)
+                        except Exception:
+                            self.app.log(f"Error in the error handler of task {entry.name}:\n" + traceback.format_exc())
+
+                    if not entry.restart:
+                        return
+
+                    await asyncio.sleep(entry.backoff)
+                    entry.backoff = min(entry.backoff * 2, TaskSupervisor.max_backoff)
+        finally:
+            if self.tasks.get(entry.name) is entry:
+                del self.tasks[entry.name]
+
+    def live_tasks(self):
+        now = asyncio.get_running_loop().time()
+
+        return [
+            {
+                "name": entry.name,
+                "runtime": round(now - entry.started_at),
+                "restarts": entry.restarts,
+                "last_error": entry.last_error,
+            }
+            for entry in self.tasks.values()
+        ]
@@ -0,0 +1,192 @@
+class RoomThermalModel:
+    """
+    Linear model of how fast a room's temperature changes, fitted by recursive least squares.
+
+        rate (degrees/hour) = c0 * (outdoor - temp) + c1 + c2 * cool + c3 * fan + c4 * heater
+
+    c0 is the heat leak towards the outdoor temperature, c1 the internal gains and the rest
+    what the AC modes and the heater add. Only the sufficient statistics X'X and X'y are kept,
+    so a sample costs O(features^2) and the history is never stored. Older samples fade out
+    with the forgetting factor, so the model follows the seasons.
+    """
+
+    features = ["leak", "gain", "cool", "fan", "heater"]
+
+    forgetting = 0.999      # per sample, about a day of memory at one sample a minute
+    ridge = 0.01            # keeps the fit solvable for inputs that never varied
+
+    def __init__(self):
+        n = len(RoomThermalModel.features)
+
+        self.xtx = [[0.0] * n for _ in range(n)]
+        self.xty = [0.0] * n
+        self.samples = 0
+
+        self.coefficients = None # solved lazily after an update
+
+    @staticmethod
+    def get_features(temp, outdoor_temp, cool, fan, heater):
+        return [outdoor_temp - temp, 1.0, float(cool), float(fan), float(heater)]
+
+    def add_sample(self, features, rate):
+        n = len(features)
+        forgetting = RoomThermalModel.forgetting
+
+        for i in range(n):
+            row = self.xtx[i]
+            xi = features[i]
+
+            for j in range(n):
+                row[j] = row[j] * forgetting + xi * features[j]
+
+            self.xty[i] = self.xty[i] * forgetting + xi * rate
+
+        self.samples += 1
+        self.coefficients = None
+
+    def get_coefficients(self):
+
+        if self.coefficients is None:
+            n = len(self.xty)
+            matrix = [row[:] + [self.xty[i]] for i, row in enumerate(self.xtx)]
+
+            for i in range(n):
+                matrix[i][i] += RoomThermalModel.ridge
+
+            self.coefficients = solve(matrix)
+
+        return self.coefficients
+
+    def predict_rate(self, features):
+        """Degrees per hour"""
+        return sum(c * x for c, x in zip(self.get_coefficients(), features))
+
+    def seconds_until(self, temp, limit, outdoor_temp, cool, fan, heater):
+        """
+        Seconds until temp rises to limit with the given inputs, None if it is not rising.
+        Linear in the current rate, meant for horizons of minutes, not hours.
+        """
+        if temp >= limit:
+            return 0.0
+
+        rate = self.predict_rate(RoomThermalModel.get_features(temp, outdoor_temp, cool, fan, heater))
+
+        if rate <= 0:
+            return None
+
+        return (limit - temp) / rate * 3600
+
+    def to_dict(self):
+        return {"xtx": [row[:] for row in self.xtx], "xty": self.xty[:], "samples": self.samples}
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls()
+
+        if len(data["xty"]) == len(cls.features):
+            model.xtx = data["xtx"]
+            model.xty = data["xty"]
+            model.samples = data["samples"]
+
+        return model
+
+def solve(matrix):
+    """Solves an augmented n x (n + 1) system by Gaussian elimination with partial pivoting"""
+
+    n = len(matrix)
+
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(matrix[row][col]))
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+
+        if abs(matrix[col][col]) < 1e-12:
+            continue
+
+        for row in range(col + 1, n):
+            factor = matrix[row][col] / matrix[col][col]
+
+            for k in range(col, n + 1):
+                matrix[row][k] -= factor * matrix[col][k]
+
+    solution = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        if abs(matrix[row][row]) < 1e-12:
+            continue
+
+        solution[row] = (matrix[row][n] - sum(matrix[row][k] * solution[k] for k in range(row + 1, n))) / matrix[row][row]
+
+    return solution
+
+class ThermalModel:
+    """One RoomThermalModel per room, fed from consecutive readings of the room temperatures"""
+
+    min_samples = 120        # samples before a room's predictions are used
+    min_sample_interval = 30 # seconds, shorter gaps are mostly sensor rounding
+    max_sample_interval = 1800
+
+    def __init__(self):
+        self.rooms: dict[str, RoomThermalModel] = {}
+        self.last = None # (timestamp, temps, outdoor temp, cool, fan, heater) of the previous reading
+
+    def get_room(self, room) -> RoomThermalModel:
+        model = self.rooms.get(room)
+
+        if model is None:
+            model = self.rooms[room] = RoomThermalModel()
+
+        return model
+
+    def observe(self, timestamp, temps: dict, outdoor_temp, cool, fan, heater):
+        """
+        Fits the change since the previous reading, the inputs are the ones that applied since then.
+        Returns the number of rooms updated.
+        """
+        updated = 0
+
+        if self.last is not None:
+            last_ts, last_temps, last_outdoor, last_cool, last_fan, last_heater = self.last
+            dt = timestamp - last_ts
+
+            if dt < ThermalModel.min_sample_interval:
+                return 0
+
+            if dt <= ThermalModel.max_sample_interval:
+                for room, temp in temps.items():
+                    last_temp = last_temps.get(room)
+
+                    if last_temp is None:
+                        continue
+
+                    features = RoomThermalModel.get_features(last_temp, last_outdoor, last_cool, last_fan, last_heater)
+                    self.get_room(room).add_sample(features, (temp - last_temp) / dt * 3600)
+                    updated += 1
+
+        self.last = (timestamp, temps, outdoor_temp, cool, fan, heater)
+        return updated
+
+    def is_ready(self, room):
+        model = self.rooms.get(room)
+        return model is not None and model.samples >= ThermalModel.min_samples
+
+    def seconds_until(self, room, temp, limit, outdoor_temp, cool=False, fan=False, heater=False):
+        """None if the room's model is not ready or the room is not warming towards limit"""
+
+        if not self.is_ready(room):
+            return None
+
+        return self.rooms[room].seconds_until(temp, limit, outdoor_temp, cool, fan, heater)
+
+    def summary(self):
+        return {
+            room: {
+                "samples": model.samples,
+                **{name: round(c, 3) for name, c in zip(RoomThermalModel.features, model.get_coefficients())},
+            }
+            for room, model in self.rooms.items()
+        }
+
+    def to_dict(self):
+        return {room: model.to_dict() for room, model in self.rooms.items()}
+
+    def restore(self, data):
+        self.rooms = {room: RoomThermalModel.from_dict(values) for room, values in data.items()}
@@ -0,0 +1,27 @@
+import time
+
+class TickTimer:
+    """
+    Splits the wall time of one control tick into named phases.
+    Each mark() adds the time since the previous mark to that phase.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.last_mark = None
+
+    def start(self):
+        self.phases = {}
+        self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last_mark
+        self.last_mark = now
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def summary(self):
+        phases = " | ".join(f"{phase}: {secs * 1000:.2f} ms" for phase, secs in self.phases.items())
+        return f"{phases} | total: {self.total() * 1000:.2f} ms"
@@ -0,0 +1,139 @@
+from array import array
+from dataclasses import dataclass
+
+DEFAULT_ZONES = ["bedroom", "office", "living_room"]
+
+@dataclass(frozen=True)
+class Zone:
+    name: str
+    temp_ent: str
+    target_ent: str
+
+def parse_zones(config) -> list[Zone]:
+    """
+    Zones from the zones app arg, a list of names or of dicts with name and optionally
+    temp_ent and target_ent. Entities default to the temp_humid sensor of the zone and
+    the ordinary climate control target temp helper.
+    """
+    zones = []
+
+    for entry in config or DEFAULT_ZONES:
+        if isinstance(entry, str):
+            entry = {"name": entry}
+
+        name = entry["name"]
+        zones.append(Zone(
+            name,
+            entry.get("temp_ent", f"sensor.{name}_temp_humid_sensor_temperature"),
+            entry.get("target_ent", f"input_number.ordinary_climate_control_target_temp_{name}"),
+        ))
+
+    names = [zone.name for zone in zones]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate zone names in {names}")
+
+    return zones
+
+class ZoneTable:
+    """
+    Temperatures, diffs and temp warning state of every zone, in arrays indexed by zone.
+
+    evaluate() works out a tick in one pass over the zones from the tick's input snapshot:
+    the diffs, the warmest zone, which temp warnings are due and their gating.
+    """
+
+    def __init__(self, zones: list[Zone]):
+        self.zones = zones
+        self.size = len(zones)
+
+        self.temps = array("d", bytes(8 * self.size))
+        self.targets = array("d", bytes(8 * self.size))
+        self.diffs = array("d", bytes(8 * self.size))
+
+        # Timestamp of the last warning, -inf before the first
+        self.last_warm_warning = array("d", [float("-inf")] * self.size)
+        self.last_cold_warning = array("d", [float("-inf")] * self.size)
+
+        # A zone only warns again after it has been back within the variability threshold,
+        # or has been warned about the other way
+        self.warm_normalized = array("b", [1] * self.size)
+        self.cold_normalized = array("b", [1] * self.size)
+
+    def evaluate(self, inputs, now, variability_threshold, warm_threshold, cold_threshold, block_timer, warnings_enabled):
+        """
+        Returns the index of the warmest zone and the warnings to send as (index, is_warm).
+        The gating of the returned warnings is already updated.
+        """
+        warmest = 0
+        warnings = []
+
+        temps, targets, diffs = self.temps, self.targets, self.diffs
+
+        for i, zone in enumerate(self.zones):
+            temp = temps[i] = float(inputs[zone.temp_ent])
+            target = targets[i] = float(inputs[zone.target_ent])
+            diff = diffs[i] = temp - target
+
+            if diff > diffs[warmest]:
+                warmest = i
+
+            if warnings_enabled:
+                if diff > warm_threshold:
+                    self.cold_normalized[i] = 1
+
+                    if now - self.last_warm_warning[i] >= block_timer and self.warm_normalized[i]:
+                        self.last_warm_warning[i] = now
+                        self.warm_normalized[i] = 0
+                        warnings.append((i, True))
+
+                elif diff < -cold_threshold:
+                    self.warm_normalized[i] = 1
+
+                    if now - self.last_cold_warning[i] >= block_timer and self.cold_normalized[i]:
+                        self.last_cold_warning[i] = now
+                        self.cold_normalized[i] = 0
+                        warnings.append((i, False))
+
+            if -variability_threshold < diff < variability_threshold:
+                self.warm_normalized[i] = 1
+                self.cold_normalized[i] = 1
+
+        return warmest, warnings
+
+    def summary(self):
+        return {
+            zone.name: f"{self.temps[i]:.2f} / {self.targets[i]:.2f} ({self.diffs[i]:+.2f})"
+            for i, zone in enumerate(self.zones)
+        }
+
+    def get_warning_state(self):
+        """JSON serializable, keyed by zone name so it survives changes to the zone list"""
+
+        def timestamp(value):
+            return value if value != float("-inf") else None
+
+        return {
+            zone.name: {
+                "last_warm_warning": timestamp(self.last_warm_warning[i]),
+                "last_cold_warning": timestamp(self.last_cold_warning[i]),
+                "warm_normalized": bool(self.warm_normalized[i]),
+                "cold_normalized": bool(self.cold_normalized[i]),
+            }
+            for i, zone in enumerate(self.zones)
+        }
+
+    def restore_warning_state(self, state):
+
+        def timestamp(value):
+            return value if value is not None else float("-inf")
+
+        for i, zone in enumerate(self.zones):
+            zone_state = state.get(zone.name)
+
+            if zone_state is None:
+                continue
+
+            self.last_warm_warning[i] = timestamp(zone_state["last_warm_warning"])
+            self.last_cold_warning[i] = timestamp(zone_state["last_cold_warning"])
+            self.warm_normalized[i] = zone_state["warm_normalized"]
+            self.cold_normalized[i] = zone_state["cold_normalized"]
@@ -0,0 +1,289 @@
+"""
+Benchmarks Home Assistant traffic and cost per control tick for every app.
+
+    python tools/bench/bench.py                     # compare against baseline.json, exit 1 on regression
+    python tools/bench/bench.py --rtt 0.05          # simulated round trip time in seconds
+    python tools/bench/bench.py --update-baseline   # accept the current numbers
+
+Runs on the fake Home Assistant from tools/replay. A climate tick is one pass of
+base_loop, a camera tick is one preset visit. Per tick it reports get_state and
+call_service calls, wall (CPU) time, latency on the virtual clock including the
+simulated round trips, and the peak memory allocated by the tick.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from statistics import mean
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "replay"))
+
+import fake_hass
+import replay
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+START_DT = datetime(2026, 1, 12, 21, 0, tzinfo=replay.TIME_ZONE)
+
+CAMERA_ARGS = {
+    "camera_name": "camera-1",
+    "is_patroling_ent": "input_boolean.camera_1_is_patroling",
+    "is_in_privacy_ent": "input_boolean.camera_1_is_in_privacy",
+    "motion_alarm_ent": "binary_sensor.camera_1_motion_alarm",
+    "switch_privacy_entity": "switch.camera_1_privacy",
+    "move_to_preset_ent": "select.camera_1_move_to_preset",
+    "presets": ["Hall", "Toilet", "Living Room"],
+    "movement_timer": 45,
+    "debug": False,
+}
+
+CAMERA_STATES = {
+    "input_boolean.camera_1_is_patroling": "on",
+    "input_boolean.camera_1_is_in_privacy": "off",
+    "binary_sensor.camera_1_motion_alarm": "off",
+    "switch.camera_1_privacy": "off",
+    "select.camera_1_move_to_preset": "Hall",
+    "input_boolean.is_sleep_state": "off",
+    "binary_sensor.bedroom_door_sensor_contact": "off",
+}
+
+# Lower is better for every metric
+METRICS = ["get_state_per_tick", "call_service_per_tick", "wall_ms_per_tick", "latency_ms_per_tick", "alloc_kib_per_tick"]
+
+
+class TickProbe:
+    """Collects the counters of each tick, start() and end() bracket one tick"""
+
+    def __init__(self, hass_world, trace_allocations):
+        self.hass_world = hass_world
+        self.trace_allocations = trace_allocations
+        self.ticks = []
+        self.started = None
+
+    def start(self):
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+
+        self.started = (
+            dict(self.hass_world.calls),
+            asyncio.get_running_loop().time(),
+            time.perf_counter(),
+            tracemalloc.get_traced_memory()[0] if self.trace_allocations else 0,
+        )
+
+    def end(self):
+        if self.started is None:
+            return
+
+        calls, virtual_start, wall_start, memory_start = self.started
+        self.started = None
+
+        self.ticks.append({
+            "get_state": self.hass_world.calls["get_state"] - calls.get("get_state", 0),
+            "call_service": self.hass_world.calls["call_service"] - calls.get("call_service", 0),
+            "latency_ms": (asyncio.get_running_loop().time() - virtual_start) * 1000,
+            "wall_ms": (time.perf_counter() - wall_start) * 1000,
+            "alloc_kib": (tracemalloc.get_traced_memory()[1] - memory_start) / 1024 if self.trace_allocations else 0,
+        })
+
+
+class ClimateTickProbeMixin:
+    # A tick is one run_tick in base_loop
+
+    async def run_tick(self):
+        self.tick_probe.start()
+        await super().run_tick()
+        self.tick_probe.end()
+
+
+class CameraTickProbeMixin:
+    # A tick runs from a dwell ending to the camera being sent to the next preset
+
+    async def call_service(self, service, **data):
+        await super().call_service(service, **data)
+
+        if service == "select/select_option" and data.get("entity_id") == self.move_to_preset_ent:
+            self.tick_probe.end()
+
+    def on_dwell_done(self):
+        self.tick_probe.start()
+        super().on_dwell_done()
+
+
+async def run_climate(controller, hours, rtt, trace_allocations, config_dir):
+    module_name, class_name, is_active_ent = replay.CONTROLLERS[controller]
+    app_class = getattr(__import__(module_name), class_name)
+
+    hass_world = fake_hass.FakeHomeAssistant(START_DT, replay.initial_states(controller, START_DT, 12.0, 22.0), rtt=rtt)
+    simulation = asyncio.ensure_future(replay.ThermalSimulation(hass_world, START_DT, 12.0, 4.0, None).run())
+
+    probe = TickProbe(hass_world, trace_allocations)
+    probed_class = type(f"Probed{class_name}", (ClimateTickProbeMixin, app_class), {"tick_probe": probe})
+
+    app = fake_hass.create_app(probed_class, hass_world, f"{controller}_climate_control", {"is_active_ent": is_active_ent}, config_dir)
+    await app.initialize()
+    await asyncio.sleep(hours * 3600)
+
+    app.stop()
+    await app.terminate()
+    simulation.cancel()
+    await asyncio.sleep(0)
+
+    return probe.ticks
+
+
+async def run_camera(hours, rtt, trace_allocations, config_dir):
+    import camera_patrol
+
+    hass_world = fake_hass.FakeHomeAssistant(START_DT, CAMERA_STATES, rtt=rtt)
+
+    probe = TickProbe(hass_world, trace_allocations)
+    probed_class = type("ProbedCameraPatrol", (CameraTickProbeMixin, camera_patrol.CameraPatrol), {"tick_probe": probe})
+
+    app = fake_hass.create_app(probed_class, hass_world, "camera_patrol_camera_1", dict(CAMERA_ARGS), config_dir)
+    await app.initialize()
+
+    # Some motion every ten minutes keeps the camera at a preset for longer
+    async def motion():
+        while True:
+            await asyncio.sleep(600)
+            hass_world.set_state(CAMERA_ARGS["motion_alarm_ent"], "on")
+            await asyncio.sleep(20)
+            hass_world.set_state(CAMERA_ARGS["motion_alarm_ent"], "off")
+
+    motion_task = asyncio.ensure_future(motion())
+    await asyncio.sleep(hours * 3600)
+
+    hass_world.set_state(CAMERA_ARGS["is_patroling_ent"], "off")
+    motion_task.cancel()
+    await app.terminate()
+    await asyncio.sleep(0)
+
+    return probe.ticks
+
+
+def run_scenario(name, hours, rtt, trace_allocations):
+    loop = fake_hass.VirtualTimeLoop()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        if trace_allocations:
+            tracemalloc.start()
+
+        try:
+            if name == "camera_patrol":
+                coro = run_camera(hours, rtt, trace_allocations, config_dir)
+            else:
+                coro = run_climate(name, hours, rtt, trace_allocations, config_dir)
+
+            return loop.run_until_complete(coro)
+        finally:
+            loop.finish_tasks()
+            if trace_allocations:
+                tracemalloc.stop()
+            loop.close()
+
+
+def summarize(ticks, allocation_ticks):
+    return {
+        "ticks": len(ticks),
+        "get_state_per_tick": round(mean(t["get_state"] for t in ticks), 3),
+        "call_service_per_tick": round(mean(t["call_service"] for t in ticks), 3),
+        "wall_ms_per_tick": round(mean(t["wall_ms"] for t in ticks), 3),
+        "latency_ms_per_tick": round(mean(t["latency_ms"] for t in ticks), 3),
+        "alloc_kib_per_tick": round(mean(t["alloc_kib"] for t in allocation_ticks), 3),
+    }
+
+
+def run_benchmarks(hours, rtt):
+    fake_hass.install()
+
+    results = {}
+    for name in ("ordinary", "sleep", "camera_patrol"):
+        # Allocation tracing slows everything down, so it gets its own run
+        ticks = run_scenario(name, hours, rtt, trace_allocations=False)
+        allocation_ticks = run_scenario(name, hours, rtt, trace_allocations=True)
+
+        results[name] = summarize(ticks, allocation_ticks)
+
+    return results
+
+
+def find_regressions(results, baseline):
+    """
+    A metric regresses when it exceeds the baseline by more than its relative tolerance and by
+    more than its absolute floor, so sub-millisecond wall times do not fail on scheduler jitter.
+    """
+    tolerances = baseline.get("tolerance", {})
+    floors = baseline.get("floor", {})
+    regressions = []
+
+    for name, metrics in baseline["results"].items():
+        for metric, expected in metrics.items():
+            if metric not in METRICS or name not in results:
+                continue
+
+            tolerance = tolerances.get(metric, tolerances.get("default", 0.0))
+            floor = floors.get(metric, 0.0)
+            actual = results[name][metric]
+
+            if actual > expected + max(expected * tolerance, floor) + 1e-9:
+                regressions.append(f"{name}.{metric}: {actual} > {expected} (+{tolerance:.0%}, at least +{floor})")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Home Assistant calls and latency per control tick")
+    parser.add_argument("--hours", type=float, default=4)
+    parser.add_argument("--rtt", type=float, default=0.02, help="simulated round trip time in seconds")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    options = parser.parse_args()
+
+    results = run_benchmarks(options.hours, options.rtt)
+    report = {"hours": options.hours, "rtt": options.rtt, "results": results}
+
+    print(json.dumps(report, indent=2))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if options.update_baseline:
+        tolerance = {"default": 0.0, "wall_ms_per_tick": 1.0, "alloc_kib_per_tick": 0.5}
+        floor = {"wall_ms_per_tick": 0.5}
+
+        if os.path.exists(options.baseline):
+            with open(options.baseline) as f:
+                previous = json.load(f)
+                tolerance = previous.get("tolerance", tolerance)
+                floor = previous.get("floor", floor)
+
+        with open(options.baseline, "w") as f:
+            json.dump(dict(report, tolerance=tolerance, floor=floor), f, indent=2)
+            f.write("\n")
+        return 0
+
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+
+    if (baseline["hours"], baseline["rtt"]) != (options.hours, options.rtt):
+        print(f"Baseline was recorded with hours={baseline['hours']} rtt={baseline['rtt']}, not comparing", file=sys.stderr)
+        return 2
+
+    regressions = find_regressions(results, baseline)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Loads a climate controller's decision log and summarizes it per column.
+
+    python tools/decision_log/read_log.py config/state/decision_log/ordinary_climate_control
+    python tools/decision_log/read_log.py config/state/decision_log/sleep_climate_control --days 30
+    python tools/decision_log/read_log.py config/state/decision_log/ordinary_climate_control --csv ticks.csv
+
+The log is written by BaseClimateControl, one record per control tick.
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "config", "apps"))
+
+import decision_log
+
+
+def summarize(values):
+    missing = decision_log.MISSING[values.typecode]
+    known = [value for value in values if not (math.isnan(value) if values.typecode in "df" else value == missing)]
+
+    if not known:
+        return "no values"
+
+    return f"min {min(known):10.2f}  mean {sum(known) / len(known):10.2f}  max {max(known):10.2f}  unknown {len(values) - len(known)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a climate controller's decision log")
+    parser.add_argument("directory", help="decision log directory of one app")
+    parser.add_argument("--days", type=float, default=None, help="only the last DAYS days")
+    parser.add_argument("--csv", help="also write the records to a CSV file")
+    options = parser.parse_args()
+
+    start = time.time() - options.days * 86400 if options.days is not None else None
+
+    load_start = time.perf_counter()
+    columns = decision_log.load(options.directory, start=start)
+    load_time = time.perf_counter() - load_start
+
+    times = columns.get("time", [])
+    print(f"{len(times)} ticks in {len(columns)} columns loaded in {load_time * 1000:.1f} ms")
+
+    if not times:
+        return
+
+    print(f"{datetime.fromtimestamp(times[0]):%Y-%m-%d %H:%M} to {datetime.fromtimestamp(times[-1]):%Y-%m-%d %H:%M}\n")
+
+    for name, values in columns.items():
+        if name != "time":
+            print(f"{name:<24} {summarize(values)}")
+
+    if options.csv:
+        with open(options.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+In-process stand-in for Home Assistant and the parts of the AppDaemon Hass API the apps use.
+
+Time is virtual: the apps run on a VirtualTimeLoop whose clock jumps straight to the
+next scheduled timer, so sleep, wait_for and call_later cost no wall time.
+
+install() must be called before importing any app module, it registers this module's
+Hass class as appdaemon.plugins.hass.hassapi.Hass.
+"""
+
+import asyncio
+import inspect
+import itertools
+import os
+import selectors
+import sys
+import types
+from collections import Counter
+from datetime import datetime, timedelta
+
+APPS_DIRS = [
+    os.path.join(os.path.dirname(__file__), "..", "..", "config", "apps"),
+    os.path.join(os.path.dirname(__file__), "..", "..", "config", "apps", "climate_control"),
+]
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """Never blocks, advances the loop's clock by the timeout instead"""
+
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+
+    def select(self, timeout=None):
+        events = super().select(0)
+
+        if not events and timeout is not None and timeout > 0:
+            self.loop.virtual_time += timeout
+
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+
+    def __init__(self):
+        self.virtual_time = 0.0
+        super().__init__(selector=VirtualSelector(self))
+
+    def time(self):
+        return self.virtual_time
+
+    def finish_tasks(self):
+        """
+        Waits for the tasks the apps cancelled in terminate to unwind, so none is destroyed
+        pending when the loop closes. A task that was never cancelled has leaked, it is
+        reported on stderr and cancelled.
+        """
+        tasks = asyncio.all_tasks(self)
+
+        for task in tasks:
+            if not task.cancelling():
+                print(f"Task still running after the apps terminated: {task.get_name()}", file=sys.stderr)
+                task.cancel()
+
+        if tasks:
+            self.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+class FakeHomeAssistant:
+    """
+    Entity states, listeners and the record of everything the apps did.
+    A service call changes the state of the entity it targets, like the real devices would.
+    """
+
+    def __init__(self, start_dt: datetime, states: dict, rtt=0.0):
+        self.start_dt = start_dt
+        self.states = dict(states)
+        self.attributes = {}
+        self.rtt = rtt
+
+        self.apps = {}
+        self.listeners = {}
+        self.handles = itertools.count(1)
+
+        self.commands = []    # (datetime, app, service, data)
+        self.timeline = []    # (datetime, app, message)
+        self.calls = Counter()
+
+    def now(self) -> datetime:
+        return self.start_dt + timedelta(seconds=asyncio.get_running_loop().time())
+
+    def monotonic(self):
+        return asyncio.get_running_loop().time()
+
+    async def round_trip(self):
+        if self.rtt > 0:
+            await asyncio.sleep(self.rtt)
+
+    def set_state(self, entity, state, attributes=None):
+        old = self.states.get(entity)
+        self.states[entity] = state
+
+        if attributes is not None:
+            self.attributes[entity] = attributes
+
+        if old != state:
+            self.dispatch_state_change(entity, old, state)
+
+    def dispatch_state_change(self, entity, old, new):
+
+        for handle, (app, callback, entity_filter, new_filter, kwargs) in list(self.listeners.items()):
+
+            if entity_filter is not None and entity_filter != entity and not entity.startswith(entity_filter + "."):
+                continue
+
+            if new_filter is not None and (new_filter(new) if callable(new_filter) else new_filter != new):
+                continue
+
+            if kwargs.get("__event"):
+                app.run_callback(callback, kwargs["__event"], {
+                    "entity_id": entity,
+                    "old_state": {"state": old},
+                    "new_state": {"state": new},
+                }, kwargs)
+            else:
+                app.run_callback(callback, entity, "state", old, new, kwargs)
+
+    def apply_service(self, service, data):
+        domain, action = service.split("/")
+        entity = data.get("entity_id")
+
+        if action == "select_option":
+            self.set_state(entity, data["option"])
+        elif action in ("turn_on", "turn_off"):
+            self.set_state(entity, action[len("turn_"):])
+        elif service == "python_script/set_state":
+            self.set_state(entity, data["state"])
+
+
+def completed(result):
+    """
+    What AppDaemon's sync_decorator returns in the event loop: the call has already been
+    made, awaiting it gives the result and not awaiting it is fine too.
+    """
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(result)
+    return future
+
+
+class Hass:
+    """The subset of appdaemon.plugins.hass.hassapi.Hass the apps use"""
+
+    def __init__(self, hass_world: FakeHomeAssistant, name, args, config_dir):
+        self.hass_world = hass_world
+        self.name = name
+        self.args = args
+        self.config_dir = config_dir
+
+        hass_world.apps[name] = self
+
+    def run_callback(self, callback, *args):
+        result = callback(*args)
+
+        if inspect.isawaitable(result):
+            asyncio.ensure_future(result)
+
+    def log(self, msg, *args, **kwargs):
+        self.hass_world.timeline.append((self.hass_world.now(), self.name, " ".join(str(m) for m in (msg,) + args)))
+
+    def error(self, msg, *args, **kwargs):
+        self.log(f"ERROR {msg}", *args)
+
+    async def get_state(self, entity_id=None, attribute=None, default=None, namespace=None, copy=True, **kwargs):
+        self.hass_world.calls["get_state"] += 1
+        await self.hass_world.round_trip()
+
+        if entity_id is None:
+            return {
+                ent: {"state": state, "attributes": self.hass_world.attributes.get(ent, {})}
+                for ent, state in self.hass_world.states.items()
+            }
+
+        if attribute == "all":
+            return {"state": self.hass_world.states.get(entity_id), "attributes": self.hass_world.attributes.get(entity_id, {})}
+
+        if attribute is not None:
+            return self.hass_world.attributes.get(entity_id, {}).get(attribute, default)
+
+        return self.hass_world.states.get(entity_id, default)
+
+    async def set_state(self, entity_id, state=None, attributes=None, **kwargs):
+        self.hass_world.calls["set_state"] += 1
+        self.hass_world.set_state(entity_id, state, attributes)
+
+    async def call_service(self, service, **data):
+        self.hass_world.calls["call_service"] += 1
+        self.hass_world.commands.append((self.hass_world.now(), self.name, service, data))
+
+        await self.hass_world.round_trip()
+        self.hass_world.apply_service(service, data)
+
+    def listen_state(self, callback, entity_id=None, new=None, immediate=False, **kwargs):
+        handle = next(self.hass_world.handles)
+        self.hass_world.listeners[handle] = (self, callback, entity_id, new, kwargs)
+
+        if immediate and entity_id in self.hass_world.states:
+            asyncio.get_running_loop().call_soon(
+                self.run_callback, callback, entity_id, "state", None, self.hass_world.states[entity_id], kwargs
+            )
+
+        return completed(handle)
+
+    def listen_event(self, callback, event=None, **kwargs):
+        # Only state_changed events exist here
+        handle = next(self.hass_world.handles)
+        self.hass_world.listeners[handle] = (self, callback, kwargs.pop("entity_id", None), None, dict(kwargs, __event=event))
+        return completed(handle)
+
+    def cancel_listen_state(self, handle, **kwargs):
+        return completed(self.hass_world.listeners.pop(handle, None) is not None)
+
+    cancel_listen_event = cancel_listen_state
+
+    def run_in(self, callback, delay, **kwargs):
+        return completed(asyncio.get_running_loop().call_later(delay, self.run_callback, callback, kwargs))
+
+    def run_at(self, callback, start: datetime, **kwargs):
+        return self.run_in(callback, max(0.0, (start - self.hass_world.now()).total_seconds()), **kwargs)
+
+    def run_every(self, callback, start, interval, **kwargs):
+        loop = asyncio.get_running_loop()
+        timer = {}
+
+        def tick():
+            timer["handle"] = loop.call_later(interval, tick)
+            self.run_callback(callback, kwargs)
+
+        # Like AppDaemon, "now" first fires one interval from now
+        delay = interval if start == "now" else max(0.0, (start - self.hass_world.now()).total_seconds())
+        timer["handle"] = loop.call_later(delay, tick)
+        return completed(timer)
+
+    def cancel_timer(self, handle, **kwargs):
+        if isinstance(handle, dict):
+            handle = handle["handle"]
+        handle.cancel()
+        return completed(True)
+
+    def create_task(self, coro, callback=None, name=None, **kwargs):
+        return asyncio.get_running_loop().create_task(coro, name=name)
+
+    async def get_app(self, name):
+        return self.hass_world.apps.get(name)
+
+    async def datetime(self, aware=False):
+        now = self.hass_world.now()
+        return now if aware else now.replace(tzinfo=None)
+
+    @staticmethod
+    async def sleep(delay, result=None):
+        return await asyncio.sleep(delay, result)
+
+
+class VirtualClockMixin:
+    """Points the Support time helpers at the virtual clock"""
+
+    def get_datetime_in_local_time(self):
+        return self.hass_world.now()
+
+    def get_timestamp(self):
+        return self.hass_world.now().timestamp()
+
+    def get_timestamp_in_seconds(self):
+        return int(self.get_timestamp())
+
+    def get_monotonic(self):
+        return self.hass_world.monotonic()
+
+
+def install():
+    """
+    Registers the fake Hass API and puts the app directories on sys.path, like AppDaemon does.
+    State snapshots are kept in memory.
+    """
+
+    module = types.ModuleType("appdaemon.plugins.hass.hassapi")
+    module.Hass = Hass
+
+    for name in ("appdaemon", "appdaemon.plugins", "appdaemon.plugins.hass"):
+        sys.modules.setdefault(name, types.ModuleType(name))
+
+    sys.modules["appdaemon.plugins.hass.hassapi"] = module
+    sys.modules["appdaemon.plugins.hass"].hassapi = module
+
+    for apps_dir in APPS_DIRS:
+        apps_dir = os.path.abspath(apps_dir)
+        if apps_dir not in sys.path:
+            sys.path.insert(0, apps_dir)
+
+    # Time is virtual, writing every snapshot to disk would be most of a run's wall time
+    import state_store
+    state_store.StateStore.memory = {}
+
+
+def create_app(app_class, hass_world, name, args, config_dir):
+    """Instantiates app_class running on the virtual clock"""
+
+    replay_class = type(f"Replay{app_class.__name__}", (VirtualClockMixin, app_class), {})
+    return replay_class(hass_world, name, args, config_dir)
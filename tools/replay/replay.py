@@ -0,0 +1,304 @@
+"""
+Replays sensor traces through the real climate controllers against a fake Home Assistant.
+
+    python tools/replay/replay.py ordinary --hours 10
+    python tools/replay/replay.py sleep --start 2026-01-12T21:00 --trace night.csv --output night.jsonl
+
+Without --trace the room temperatures, outdoor temperature and AC power draw come from a
+simple thermal simulation that reacts to the AC mode and heater the controller sets.
+A trace is a CSV with the columns seconds,entity,state, its rows are applied at
+start + seconds and override the simulation for those entities.
+
+Prints a summary, --output writes the command stream and decision timeline as JSON lines.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import fake_hass
+
+TIME_ZONE = ZoneInfo("Europe/Stockholm")
+
+ROOMS = ["bedroom", "office", "living_room"]
+
+CONTROLLERS = {
+    "ordinary": ("ordinary_climate_control", "OrdinaryClimateControl", "input_boolean.ordinary_climate_control"),
+    "sleep": ("sleep_climate_control", "SleepClimateControl", "input_boolean.sleep_climate_control"),
+}
+
+BASE_SETTINGS = {
+    "input_number.climate_control_polling_interval": "60",
+    "input_number.climate_control_compressor_outside_temp_cutoff": "5",
+    "input_number.climate_control_compressor_low_draw_threshold": "300",
+    "input_number.climate_control_compressor_max_low_draw_duration": "600",
+    "input_number.climate_control_defrost_cycle_duration": "10",
+    "input_boolean.climate_control_disable_ac_compressor": "off",
+    "input_boolean.climate_control_disable_external_ac_fan": "off",
+    "input_boolean.climate_control_disable_freeze_warnings": "off",
+}
+
+ORDINARY_SETTINGS = {
+    "input_number.ordinary_climate_control_variability_threshold": "0.5",
+    "input_number.ordinary_climate_control_temp_warning_threshold_cold": "3",
+    "input_number.ordinary_climate_control_temp_warning_threshold_warm": "3",
+    "input_number.ordinary_climate_control_repeated_warnings_block_timer": "3600",
+    "input_boolean.ordinary_climate_control_disable_temp_warnings": "off",
+    "input_number.ordinary_climate_control_min_time_fan_per_hour": "10",
+    "input_number.ordinary_climate_control_target_temp_bedroom": "20",
+    "input_number.ordinary_climate_control_target_temp_office": "21",
+    "input_number.ordinary_climate_control_target_temp_living_room": "21",
+}
+
+SLEEP_SETTINGS = {
+    "input_number.sleep_climate_control_target_evening_temp": "18",
+    "input_number.sleep_climate_control_target_morning_temp": "21",
+    "input_number.sleep_climate_control_warmup_cycles": "4",
+    "input_number.sleep_climate_control_variability_threshold": "0.5",
+    "input_datetime.sleep_climate_control_warmup_weekdays_time": "05:00:00",
+    "input_datetime.sleep_climate_control_warmup_weekend_time": "07:00:00",
+    "input_datetime.sleep_climate_control_wakeup_weekdays_time": "07:00:00",
+    "input_datetime.sleep_climate_control_wakeup_weekend_time": "09:00:00",
+    "input_boolean.sleep_climate_control_disable_heater": "off",
+    "input_boolean.sleep_climate_control_disable_alarm_wakeup": "off",
+    "input_number.sleep_climate_control_min_time_fan_per_hour": "10",
+}
+
+DEVICES = {
+    "select.nedis_ir_controller_ac_mode": "Off",
+    "switch.smart_socket_1": "off",
+    "switch.smart_socket_4": "off",
+    "sensor.smart_socket_3_power": "2",
+    "input_boolean.ordinary_climate_control": "off",
+    "input_boolean.sleep_climate_control": "off",
+}
+
+
+def initial_states(controller, start_dt, outdoor_temp, room_temp):
+    states = dict(BASE_SETTINGS, **ORDINARY_SETTINGS, **SLEEP_SETTINGS, **DEVICES)
+
+    for room in ROOMS:
+        states[f"sensor.{room}_temp_humid_sensor_temperature"] = str(room_temp)
+
+    states["sensor.outside_forest_side_temp_humid_sensor_temperature"] = str(outdoor_temp)
+    states["sensor.outside_city_side_temp_humid_sensor_temperature"] = str(outdoor_temp)
+
+    # Next morning at 07:00
+    alarm_dt = (start_dt + timedelta(hours=12)).replace(hour=7, minute=0, second=0, microsecond=0)
+    states["sensor.robins_oneplus_13_next_alarm"] = alarm_dt.isoformat()
+
+    states[CONTROLLERS[controller][2]] = "on"
+    return states
+
+
+class ThermalSimulation:
+    """
+    Rooms lose heat towards the outdoor temperature and gain it from internal loads.
+    The AC cools the bedroom the most, the heater only warms the bedroom.
+    """
+
+    step = 60 # seconds
+
+    leak_rate = 0.00005         # 1/s towards outdoor temp
+    internal_gain = 0.00025     # degrees/s
+    cooling = {"Cool": 0.0012, "Fan": 0.0002, "Off": 0.0}
+    cooling_share = {"bedroom": 1.0, "office": 0.5, "living_room": 0.3}
+    heater = 0.0006             # degrees/s in the bedroom
+    power = {"Cool": 550.0, "Fan": 40.0, "Off": 2.0}
+
+    def __init__(self, hass_world, start_dt, outdoor_mean, outdoor_swing, freeze_after):
+        self.hass_world = hass_world
+        self.start_dt = start_dt
+        self.outdoor_mean = outdoor_mean
+        self.outdoor_swing = outdoor_swing
+        self.freeze_after = freeze_after
+        self.overridden = set()
+
+        self.temps = {
+            room: float(hass_world.states[f"sensor.{room}_temp_humid_sensor_temperature"])
+            for room in ROOMS
+        }
+        self.cool_seconds = 0
+
+    def outdoor_temp(self, dt):
+        # Coldest at 04:00
+        hours = dt.hour + dt.minute / 60
+        return self.outdoor_mean + self.outdoor_swing * math.cos((hours - 16) / 24 * 2 * math.pi)
+
+    def advance(self):
+        states = self.hass_world.states
+        now = self.hass_world.now()
+
+        mode = states["select.nedis_ir_controller_ac_mode"]
+        heater_on = states["switch.smart_socket_1"] == "on"
+        outdoor = self.outdoor_temp(now)
+
+        self.cool_seconds = self.cool_seconds + self.step if mode == "Cool" else 0
+
+        for room in ROOMS:
+            temp = self.temps[room]
+            temp += self.step * (self.leak_rate * (outdoor - temp) + self.internal_gain)
+            temp -= self.step * self.cooling[mode] * self.cooling_share[room]
+
+            if heater_on and room == "bedroom":
+                temp += self.step * self.heater
+
+            self.temps[room] = temp
+            self.publish(f"sensor.{room}_temp_humid_sensor_temperature", f"{temp:.1f}")
+
+        self.publish("sensor.outside_forest_side_temp_humid_sensor_temperature", f"{outdoor:.1f}")
+
+        power = self.power[mode]
+        # The radiator freezes over after running the compressor for a long time
+        if self.freeze_after and self.cool_seconds > self.freeze_after:
+            power = 200.0
+        self.publish("sensor.smart_socket_3_power", f"{power:.0f}")
+
+    def publish(self, entity, state):
+        if entity not in self.overridden:
+            self.hass_world.set_state(entity, state)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.step)
+            self.advance()
+
+
+def load_trace(path):
+    with open(path, newline="") as f:
+        rows = [(float(row["seconds"]), row["entity"], row["state"]) for row in csv.DictReader(f)]
+
+    return sorted(rows, key=lambda row: row[0])
+
+
+async def play_trace(hass_world, rows):
+    loop = asyncio.get_running_loop()
+
+    for seconds, entity, state in rows:
+        await asyncio.sleep(max(0.0, seconds - loop.time()))
+        hass_world.set_state(entity, state)
+
+
+async def replay(controller, start_dt, hours, trace=None, args=None, config_dir=None,
+                 outdoor_mean=12.0, outdoor_swing=4.0, room_temp=22.0, freeze_after=None, rtt=0.0):
+    """Runs a controller for hours of virtual time, returns the FakeHomeAssistant with the recorded run"""
+
+    module_name, class_name, is_active_ent = CONTROLLERS[controller]
+    app_class = getattr(__import__(module_name), class_name)
+
+    hass_world = fake_hass.FakeHomeAssistant(
+        start_dt,
+        initial_states(controller, start_dt, outdoor_mean, room_temp),
+        rtt=rtt
+    )
+    simulation = ThermalSimulation(hass_world, start_dt, outdoor_mean, outdoor_swing, freeze_after)
+
+    background = [asyncio.ensure_future(simulation.run())]
+    if trace:
+        simulation.overridden = {entity for _, entity, _ in trace}
+        background.append(asyncio.ensure_future(play_trace(hass_world, trace)))
+
+    app_args = {"is_active_ent": is_active_ent, "dev_logs": True}
+    app_args.update(args or {})
+
+    app = fake_hass.create_app(app_class, hass_world, f"{controller}_climate_control", app_args, config_dir)
+    await app.initialize()
+
+    await asyncio.sleep(hours * 3600)
+
+    app.stop()
+    await app.terminate()
+
+    for task in background:
+        task.cancel()
+
+    # Lets cancelled tasks unwind
+    await asyncio.sleep(0)
+
+    return hass_world
+
+
+def run(controller, **kwargs):
+    fake_hass.install()
+
+    loop = fake_hass.VirtualTimeLoop()
+    try:
+        return loop.run_until_complete(replay(controller, **kwargs))
+    finally:
+        loop.finish_tasks()
+        loop.close()
+
+
+def write_jsonl(hass_world, path):
+    events = (
+        [(dt, {"type": "command", "app": app, "service": service, "data": data}) for dt, app, service, data in hass_world.commands] +
+        [(dt, {"type": "log", "app": app, "message": message}) for dt, app, message in hass_world.timeline]
+    )
+    events.sort(key=lambda event: event[0])
+
+    with open(path, "w") as f:
+        for dt, event in events:
+            f.write(json.dumps(dict(time=dt.isoformat(), **event), default=str) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sensor traces through a climate controller")
+    parser.add_argument("controller", choices=CONTROLLERS)
+    parser.add_argument("--start", default=None, help="local start time, YYYY-MM-DDTHH:MM (default: today 21:00)")
+    parser.add_argument("--hours", type=float, default=10)
+    parser.add_argument("--trace", help="CSV with seconds,entity,state rows")
+    parser.add_argument("--output", help="write commands and decision log as JSON lines")
+    parser.add_argument("--outdoor-mean", type=float, default=12.0)
+    parser.add_argument("--outdoor-swing", type=float, default=4.0)
+    parser.add_argument("--room-temp", type=float, default=22.0)
+    parser.add_argument("--freeze-after", type=float, default=None, help="seconds of compressor run before the power draw drops")
+    parser.add_argument("--arg", action="append", default=[], metavar="KEY=VALUE", help="extra app argument")
+    parser.add_argument("--config-dir", help="keep the decision log here instead of in a temporary directory")
+    options = parser.parse_args()
+
+    if options.start:
+        start_dt = datetime.fromisoformat(options.start).replace(tzinfo=TIME_ZONE)
+    else:
+        start_dt = datetime.now(TIME_ZONE).replace(hour=21, minute=0, second=0, microsecond=0)
+
+    args = dict(arg.split("=", 1) for arg in options.arg)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_dir = options.config_dir or temp_dir
+        wall_start = time.perf_counter()
+
+        hass_world = run(
+            options.controller,
+            start_dt=start_dt,
+            hours=options.hours,
+            trace=load_trace(options.trace) if options.trace else None,
+            args=args,
+            config_dir=config_dir,
+            outdoor_mean=options.outdoor_mean,
+            outdoor_swing=options.outdoor_swing,
+            room_temp=options.room_temp,
+            freeze_after=options.freeze_after,
+        )
+
+        wall_time = time.perf_counter() - wall_start
+
+    for dt, app, service, data in hass_world.commands:
+        target = data.get("option") or data.get("entity_id")
+        print(f"{dt:%H:%M:%S}  {service:<24} {data.get('entity_id', '')}  {target if 'option' in data else ''}")
+
+    print(f"\n{options.hours} h simulated in {wall_time:.3f} s | "
+          f"get_state: {hass_world.calls['get_state']} | call_service: {hass_world.calls['call_service']}")
+
+    if options.output:
+        write_jsonl(hass_world, options.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())